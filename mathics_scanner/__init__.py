@@ -18,10 +18,14 @@ from mathics_scanner.errors import (
     SyntaxError,
 )
 from mathics_scanner.feed import (
+    AsyncLineFeeder,
+    EncodingDetectingFileLineFeeder,
     FileLineFeeder,
     LineFeeder,
+    MappedFileLineFeeder,
     MultiLineFeeder,
     SingleLineFeeder,
+    SourceRetention,
 )
 
 # TODO: Move is_symbol_name to the characters module
@@ -30,13 +34,17 @@ from mathics_scanner.version import __version__
 
 __all__ = [
     "ALIASED_CHARACTERS",
+    "AsyncLineFeeder",
+    "EncodingDetectingFileLineFeeder",
     "FileLineFeeder",
     "IncompleteSyntaxError",
     "InvalidSyntaxError",
     "LineFeeder",
+    "MappedFileLineFeeder",
     "MultiLineFeeder",
     "NAMED_CHARACTERS",
     "SingleLineFeeder",
+    "SourceRetention",
     "SyntaxError",
     # "Token",
     # "Tokeniser",
@@ -44,4 +52,15 @@ __all__ = [
     # "is_symbol_name",
     "replace_unicode_with_wl",
     "replace_wl_with_plain_text",
+    "tokenize_files",
 ]
+
+
+def __getattr__(name: str):
+    # The tokeniser needs the JSON tables, which are built by scripts
+    # that import this package. So it is only imported when asked for.
+    if name == "tokenize_files":
+        from mathics_scanner.parallel import tokenize_files
+
+        return tokenize_files
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Tokenization of input that arrives asynchronously, as in
+
+    async for token in AsyncTokeniser(feeder):
+        ...
+
+where ``feeder`` is an ``AsyncLineFeeder``.
+
+Scanning is done by the synchronous ``Tokeniser`` on the lines that
+have arrived so far. When a token continues past those lines, for
+example a String or comment spread over several lines, scanning stops
+where those lines end, waits for another line, and then continues from
+there. So the event loop is never blocked waiting for the rest of a
+token, and a token spread over many lines is scanned only once.
+"""
+
+from typing import Optional
+
+from mathics_scanner.feed import AsyncLineFeeder
+from mathics_scanner.tokeniser import Token, Tokeniser
+
+
+class MoreInputNeeded(Exception):
+    """Raised by scanning when a token needs a line that has not arrived
+    yet"""
+
+
+class WaitingTokeniser(Tokeniser):
+    """
+    A ``Tokeniser`` which, rather than finding no more input, raises
+    ``MoreInputNeeded`` when its ``AsyncLineFeeder`` has no lines
+    queued but might get more.
+
+    Once a line has arrived, ``next()`` continues the scan that was
+    stopped: inside a comment or a String, it continues from the end of
+    the input it had. Other tokens need more input only right at the
+    end of a line, so for those the whole token is scanned again.
+    """
+
+    def get_more_input(self):
+        feeder = self.feeder
+        if not feeder.pending and not feeder.eof:
+            raise MoreInputNeeded()
+        super().get_more_input()
+
+    def next(self) -> Token:
+        if self._lookahead_count:
+            return super().next()
+        if self._comment_depth:
+            # Skip the rest of the comment, then scan the token after it.
+            self._skip_comment(self._comment_depth)
+        elif self._string_segments is not None:
+            return self._scan_string(self._string_segments)
+        return super().next()
+
+
+class AsyncTokeniser:
+    """
+    An asynchronous iterator over the tokens of the input from an
+    ``AsyncLineFeeder``, not including the final "END" token.
+
+    A token spanning many lines is scanned as its lines arrive.
+    """
+
+    def __init__(self, feeder: AsyncLineFeeder):
+        self.feeder = feeder
+        # Created once the first line has arrived.
+        self.tokeniser: Optional[WaitingTokeniser] = None
+
+    def __aiter__(self) -> "AsyncTokeniser":
+        return self
+
+    async def __anext__(self) -> Token:
+        feeder = self.feeder
+        if self.tokeniser is None:
+            await feeder.fill()
+            self.tokeniser = WaitingTokeniser(feeder)
+        tokeniser = self.tokeniser
+
+        while True:
+            try:
+                token = tokeniser.next()
+            except MoreInputNeeded:
+                # Continue scanning once another line has arrived.
+                await feeder.fill()
+                continue
+
+            if token.tag == "END":
+                if not (feeder.pending or await feeder.fill()):
+                    raise StopAsyncIteration
+                tokeniser._add_input(feeder.feed())
+                continue
+            return token
@@ -14,6 +14,11 @@ class SyntaxError(Exception):
         self.tag = tag
         self.args = args
 
+    def __reduce__(self):
+        # Needed for pickling, e.g. to pass an error back from another
+        # process, since the tag is not in ``args``.
+        return (self.__class__, (self.tag,) + tuple(self.args))
+
 
 class EscapeSyntaxError(SyntaxError):
     """Escape sequence syntax error"""
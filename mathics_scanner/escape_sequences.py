@@ -2,7 +2,7 @@
 Helper Module for tokenizing character escape sequences.
 """
 
-from typing import Final, Optional, Tuple
+from typing import Dict, Final, Optional, Tuple
 
 from mathics_scanner.characters import BOXING_ASCII_TO_UNICODE, NAMED_CHARACTERS
 from mathics_scanner.errors import (
@@ -19,6 +19,23 @@ BOX_OPERATOR: Final[str] = "&@`!^)(%*/_"
 # are valid in a Mathics3 escaped character.
 ESCAPE_CODES: Final[str] = 'ntbfr" $\n'
 
+# The values of escape sequences made of a backslash followed by a
+# single character: either one of ESCAPE_CODES, or a second backslash.
+# These have the same value inside and outside of a string.
+SINGLE_CHARACTER_ESCAPES: Final[Dict[str, str]] = {
+    "\\": "\\",
+    "n": "\n",
+    "\n": "\n",
+    '"': '"',
+    " ": " ",
+    "t": "\t",
+    "b": "\b",
+    "f": "\f",
+    # I don't know why \$ is defined, but it is!
+    "$": r"\$",
+    "r": "\r",
+}
+
 # Valid digits in an Octal string
 OCTAL_DIGITS: Final[str] = "01234567"
 
@@ -88,8 +105,9 @@ def parse_escape_sequence(
     """
     result = ""
     c = source_text[pos]
-    if c == "\\":
-        return "\\", pos + 1
+    escaped = SINGLE_CHARACTER_ESCAPES.get(c)
+    if escaped is not None:
+        return escaped, pos + 1
 
     # https://www.wolfram.com/language/12/networking-and-system-operations/use-the-full-range-of-unicode-characters.html
     # describes hex encoding.
@@ -131,30 +149,11 @@ def parse_escape_sequence(
         result += parse_base(source_text, pos, pos + 3, 8)
         pos += 3
 
-    # WMA escape characters \n, \t, \b, \r.
+    # WMA escape characters \n, \t, \b, \r, and the others in
+    # ESCAPE_CODES have been handled above using SINGLE_CHARACTER_ESCAPES.
     # Note that these are similar to Python, but are different.
     # In particular, Python defines "\a" to be ^G (control G),
     # but in WMA, this is invalid.
-    elif c in ESCAPE_CODES:
-        if c in "n\n":
-            result += "\n"
-        elif c == '"':
-            result += '"'
-        elif c == " ":
-            result += " "
-        elif c == "t":
-            result += "\t"
-        elif c == "b":
-            result += "\b"
-        elif c == "f":
-            result += "\f"
-        elif c in '$"':
-            # I don't know why \$ is defined, but it is!
-            result += rf"\{c}"
-        else:
-            assert c == "r"
-            result += "\r"
-        pos += 1
     elif is_in_string and c in BOX_OPERATOR:
         if (boxed_character := BOXING_ASCII_TO_UNICODE.get("\\" + c)) is not None:
             # Replace \ in result with Unicode representing the two ASCII characters.
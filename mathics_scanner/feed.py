@@ -4,11 +4,54 @@ Rather than trying to parse all the lines of code at once, this module implement
 methods for returning one line code at a time.
 """
 
+import codecs
+import io
+import mmap
+import os
+import os.path as osp
+import stat
 from abc import ABCMeta, abstractmethod
-from typing import Callable, List, Optional
+from collections import deque
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Tuple
 
 import mathics_scanner
-from mathics_scanner.location import MATHICS3_PATHS, ContainerKind
+from mathics_scanner.location import ContainerKind, LineStarts
+from mathics_scanner.source_buffer import SourceBuffer
+
+try:
+    import chardet
+except ImportError:
+    chardet = None
+
+# Byte-order marks, and the encodings that remove them when decoding.
+# UTF-32 comes first since its little-endian mark starts with UTF-16's.
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# The number of bytes at the start of a file that its encoding is
+# detected from.
+DETECTION_BLOCK_SIZE = 64 * 1024
+
+# The number of bytes read from a binary file at a time to be decoded.
+DECODING_BLOCK_SIZE = 1024 * 1024
+
+# The encoding detected for each file path, with the modification time
+# of the file when it was detected.
+_detected_encodings: Dict[str, Tuple[int, str]] = {}
+
+
+class SourceRetention(Enum):
+    "How much of the text that has been fed a feeder keeps in ``source_text``"
+
+    NONE = 0  # None of it
+    STATEMENT = 1  # The lines of the statement being read
+    FULL = 2  # All of it, for example for error reporting
 
 
 class LineFeeder(metaclass=ABCMeta):
@@ -18,11 +61,22 @@ class LineFeeder(metaclass=ABCMeta):
     as well to store messages regarding tokenization errors.
     """
 
-    def __init__(self, container, container_kind=ContainerKind.UNKNOWN):
+    # The text fed so far that is kept, if the feeder keeps any. Feeders
+    # that keep it in another form make this a read-only property.
+    source_text: Optional[str] = None
+
+    def __init__(
+        self,
+        container,
+        container_kind=ContainerKind.UNKNOWN,
+        retention: SourceRetention = SourceRetention.FULL,
+    ):
         """
         :param container_name: A string that describes the source of
           the feeder, i.e., the file path that is being feed, or the
           Python source code path, or an open terminal shell stream.
+        :param retention: How much of the text fed is kept in
+          ``source_text``. Not all feeders follow this.
         """
 
         # A message is a list that starts out with a "symbol_name", like "Part",
@@ -33,20 +87,30 @@ class LineFeeder(metaclass=ABCMeta):
         self.lineno: int = 0
         self.container = container
         self.container_kind = container_kind
-        self.source_text: Optional[str] = None
+        self.retention = retention
+
+        # Where the lines fed start, for finding the line and column of
+        # a position in the text fed. Feeders add each line to this as
+        # they feed it. It has an entry for every line, so it is only
+        # kept when locations are tracked or track_line_starts() is
+        # called.
+        self.line_starts: Optional[LineStarts] = (
+            LineStarts() if mathics_scanner.location.TRACK_LOCATIONS else None
+        )
 
         self.container_index = -1
 
         # Note: fully qualified name is needed to pick up dynamic changes
-        if mathics_scanner.location.TRACK_LOCATIONS and container:
-            if container_kind == ContainerKind.FILE:
-                if container in MATHICS3_PATHS:
-                    self.container_index = MATHICS3_PATHS.index(container)
-                else:
-                    self.container_index = len(MATHICS3_PATHS)
-                    MATHICS3_PATHS.append(container)
-            elif container_kind == ContainerKind.STREAM:
-                self.container.append(self.source_text)
+        if (
+            mathics_scanner.location.TRACK_LOCATIONS
+            and container
+            and isinstance(container, str)
+            and container_kind
+            in (ContainerKind.FILE, ContainerKind.STREAM, ContainerKind.STRING)
+        ):
+            self.container_index = mathics_scanner.location.CONTAINERS.register(
+                container, container_kind
+            )
 
     @abstractmethod
     def feed(self) -> str:
@@ -64,6 +128,26 @@ class LineFeeder(metaclass=ABCMeta):
         """
         ...
 
+    def track_line_starts(self) -> None:
+        """
+        Record where the lines fed start in ``line_starts``, even if
+        locations are not tracked. This should be called before any line
+        is fed.
+        """
+        if self.line_starts is None:
+            self.line_starts = LineStarts()
+
+    def start_statement(self) -> None:
+        """
+        Note that a new statement is about to be read. With
+        ``SourceRetention.STATEMENT``, the text kept before the last line
+        fed is discarded, since the new statement starts on or after
+        that line. Unless the retention is ``SourceRetention.FULL``,
+        ``line_starts`` also forgets where the lines before it start.
+        """
+        if self.retention is not SourceRetention.FULL and self.line_starts:
+            self.line_starts.discard(self.line_starts.last_start)
+
     def message(self, symbol_name: str, tag: str, *args) -> None:
         """
 
@@ -127,28 +211,60 @@ class LineFeeder(metaclass=ABCMeta):
 class MultiLineFeeder(LineFeeder):
     "A feeder that feeds one line at a time."
 
-    def __init__(self, lines, container, container_kind=ContainerKind.UNKNOWN):
+    def __init__(
+        self,
+        lines,
+        container,
+        container_kind=ContainerKind.UNKNOWN,
+        retention: SourceRetention = SourceRetention.FULL,
+    ):
         """
         :param lines: The source of the feeder (a string).
         :param container_name: A string that describes the source of the feeder,
           i.e. the file path that is being feed.
+        :param retention: How much of the text fed is kept in
+          ``source_text``. Lines that are not kept are let go of.
         """
-        super(MultiLineFeeder, self).__init__(container, container_kind)
+        super(MultiLineFeeder, self).__init__(container, container_kind, retention)
         self.lineno = 0
 
         if isinstance(lines, str):
             self.lines = lines.splitlines(True)
         else:
-            self.lines = lines
+            # Lines that are not kept are replaced with None, so use a copy.
+            # The retention can be changed later, as by a StreamingTokeniser.
+            self.lines = list(lines)
+
+        # The index of the first line kept in source_text.
+        self.first_kept_line = 0
+
+    @property
+    def source_text(self) -> str:
+        "The text fed so far that is kept"
+        if self.retention is SourceRetention.NONE:
+            return ""
+        return "".join(self.lines[self.first_kept_line : self.lineno])
 
     def feed(self) -> str:
         if self.lineno < len(self.lines):
             result = self.lines[self.lineno]
+            if self.retention is SourceRetention.NONE:
+                self.lines[self.lineno] = None
+            if self.line_starts is not None:
+                self.line_starts.add(result, self.lineno)
             self.lineno += 1
         else:
             result = ""
         return result
 
+    def start_statement(self) -> None:
+        super().start_statement()
+        if self.retention is SourceRetention.STATEMENT and self.lineno > 1:
+            last_fed_line = self.lineno - 1
+            for index in range(self.first_kept_line, last_fed_line):
+                self.lines[index] = None
+            self.first_kept_line = last_fed_line
+
     def empty(self) -> bool:
         return self.lineno >= len(self.lines)
 
@@ -166,14 +282,14 @@ class SingleLineFeeder(LineFeeder):
         """
         super().__init__(container, container_kind)
         self.source_text = source_text
-        if container_kind == ContainerKind.STREAM:
-            self.container.append[source_text]
         self._empty = False
 
     def feed(self) -> str:
         if self._empty:
             return ""
         self._empty = True
+        if self.line_starts is not None:
+            self.line_starts.add(self.source_text, self.lineno)
         self.lineno += 1
         return self.source_text
 
@@ -184,34 +300,310 @@ class SingleLineFeeder(LineFeeder):
 class FileLineFeeder(LineFeeder):
     "A feeder that feeds lines from an open ``File`` object"
 
-    def __init__(self, fileobject, trace_fn: Optional[Callable] = None):
+    def __init__(
+        self,
+        fileobject,
+        trace_fn: Optional[Callable] = None,
+        retention: SourceRetention = SourceRetention.FULL,
+    ):
         """
         :param fileobject: The source of the feeder (a string).
         :param filename: A string that describes the source of the feeder,
                            i.e.,  the filename that is being fed.
+        :param retention: How much of the text read is kept in
+          ``source_text``.
         """
-        super().__init__(fileobject.name, container_kind=ContainerKind.FILE)
+        super().__init__(
+            fileobject.name, container_kind=ContainerKind.FILE, retention=retention
+        )
         self.fileobject = fileobject
         self.lineno = 0
         self.eof = False
         self.trace_fn = trace_fn
-        self.source_text = ""
+
+        # The text is kept as a list of lines, since adding each line to
+        # a single string would take time quadratic in the file length.
+        self.source_buffer = SourceBuffer("")
+
+        # The offset in source_buffer of the last line fed.
+        self.last_line_start = 0
+
+    @property
+    def source_text(self) -> str:
+        "The text read so far that is kept"
+        return str(self.source_buffer)
 
     def feed(self) -> str:
+        keep_text = self.retention is not SourceRetention.NONE
         result = self.fileobject.readline()
-        self.source_text += result
+        if keep_text:
+            self.source_buffer.append(result)
         while result == "\n":
             result = self.fileobject.readline()
             self.lineno += 1
-            self.source_text += result
+            if keep_text:
+                self.source_buffer.append(result)
 
             if self.trace_fn:
                 self.trace_fn(self.lineno, result)
         if result:
+            if self.line_starts is not None:
+                self.line_starts.add(result, self.lineno)
             self.lineno += 1
         else:
             self.eof = True
+        if keep_text:
+            self.last_line_start = len(self.source_buffer) - len(result)
         return result
 
+    def start_statement(self) -> None:
+        super().start_statement()
+        if self.retention is SourceRetention.STATEMENT:
+            self.source_buffer.discard(self.last_line_start)
+
     def empty(self) -> bool:
         return self.eof
+
+
+def detect_encoding(head: bytes, default: str = "utf-8") -> str:
+    """
+    Return the encoding of a file that starts with the bytes ``head``.
+
+    A byte-order mark is used if there is one. Otherwise UTF-8 is used
+    if ``head`` is valid UTF-8, and if not, the encoding is guessed with
+    ``chardet``. ``default`` is returned if ``chardet`` is not installed
+    or cannot guess.
+    """
+    for bom, encoding in BOM_ENCODINGS:
+        if head.startswith(bom):
+            return encoding
+    try:
+        # The head may end part way through a character.
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    if chardet is not None:
+        encoding = chardet.detect(head)["encoding"]
+        if encoding is not None:
+            return encoding
+    return default
+
+
+class _PrefixedReader(io.RawIOBase):
+    """
+    A binary file which reads ``prefix``, and then the rest of the binary
+    file ``fileobject``. Closing it leaves ``fileobject`` open.
+    """
+
+    def __init__(self, prefix: bytes, fileobject):
+        super().__init__()
+        self.prefix = memoryview(prefix)
+        self.fileobject = fileobject
+        self.name = fileobject.name
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self.prefix:
+            return self.fileobject.readinto(buffer)
+        count = min(len(buffer), len(self.prefix))
+        buffer[:count] = self.prefix[:count]
+        self.prefix = self.prefix[count:]
+        return count
+
+
+class AsyncLineFeeder(LineFeeder):
+    """
+    An abstract feeder whose lines are read with ``await``, for example
+    from an asyncio stream.
+
+    Lines are read ahead by ``fill()`` into a queue, and ``feed()`` hands
+    out the lines queued so far. So the tokeniser's scanning code, which
+    calls ``feed()``, is shared with synchronous feeders. See
+    ``AsyncTokeniser``.
+    """
+
+    def __init__(self, container, container_kind=ContainerKind.UNKNOWN):
+        super().__init__(container, container_kind)
+        self.pending: deque = deque()
+        self.eof = False
+
+    @abstractmethod
+    async def read_line(self) -> str:
+        """
+        Wait for the next line and return it. A newline character
+        should follow each line. Returns '' after all lines are read.
+        """
+        ...
+
+    async def fill(self) -> bool:
+        """
+        Wait for the next line and queue it. Return False if there are no
+        more lines.
+        """
+        if self.eof:
+            return False
+        line = await self.read_line()
+        if not line:
+            self.eof = True
+            return False
+        self.pending.append(line)
+        return True
+
+    def feed(self) -> str:
+        if not self.pending:
+            return ""
+        result = self.pending.popleft()
+        if self.line_starts is not None:
+            self.line_starts.add(result, self.lineno)
+        self.lineno += 1
+        return result
+
+    def empty(self) -> bool:
+        return self.eof and not self.pending
+
+
+class MappedFileLineFeeder(FileLineFeeder):
+    """
+    A feeder that feeds lines from an open binary ``File`` object, which
+    is read all at once, mapping it into memory where possible, and
+    decoded and split into lines once.
+
+    Line numbers and messages are the same as for ``FileLineFeeder`` on
+    the file opened as text. Lines that ``retention`` does not keep are
+    let go of.
+    """
+
+    def __init__(
+        self,
+        fileobject,
+        encoding: str = "utf-8",
+        trace_fn: Optional[Callable] = None,
+        retention: SourceRetention = SourceRetention.FULL,
+    ):
+        """
+        :param fileobject: The source of the feeder, opened in binary mode.
+        :param encoding: The encoding of the file.
+        :param retention: How much of the text read is kept in
+          ``source_text``.
+        """
+        super().__init__(fileobject, trace_fn, retention)
+        try:
+            with mmap.mmap(
+                fileobject.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapped_file:
+                text = str(mapped_file, encoding)
+        except (OSError, ValueError):
+            # The file is empty or cannot be mapped, e.g. a pipe.
+            text = str(fileobject.read(), encoding)
+
+        # Newlines are translated as in a file opened in text mode.
+        self.lines: List[Optional[str]] = io.StringIO(text, newline=None).readlines()
+        self.line_index = 0
+
+        # The index of the first line kept in source_text.
+        self.first_kept_line = 0
+
+    @property
+    def source_text(self) -> str:
+        "The text read so far that is kept"
+        if self.retention is SourceRetention.NONE:
+            return ""
+        return "".join(self.lines[self.first_kept_line : self.line_index])
+
+    def feed(self) -> str:
+        lines = self.lines
+        line_index = self.line_index
+        result = lines[line_index] if line_index < len(lines) else ""
+        line_index += 1
+        while result == "\n":
+            result = lines[line_index] if line_index < len(lines) else ""
+            line_index += 1
+            self.lineno += 1
+
+            if self.trace_fn:
+                self.trace_fn(self.lineno, result)
+        if self.retention is SourceRetention.NONE:
+            end = min(line_index, len(lines))
+            lines[self.line_index : end] = [None] * (end - self.line_index)
+        self.line_index = line_index
+        if result:
+            if self.line_starts is not None:
+                self.line_starts.add(result, self.lineno)
+            self.lineno += 1
+        else:
+            self.eof = True
+        return result
+
+    def start_statement(self) -> None:
+        super().start_statement()
+        if self.retention is SourceRetention.STATEMENT and self.line_index > 1:
+            last_fed_line = min(self.line_index, len(self.lines)) - 1
+            first_kept_line = self.first_kept_line
+            self.lines[first_kept_line:last_fed_line] = [None] * (
+                last_fed_line - first_kept_line
+            )
+            self.first_kept_line = last_fed_line
+
+
+class EncodingDetectingFileLineFeeder(FileLineFeeder):
+    """
+    A feeder that feeds lines from an open binary ``File`` object whose
+    encoding is detected by ``detect_encoding()`` from its first block.
+
+    The encoding detected is remembered for the file's path and
+    modification time, so that reading the file again does not detect
+    it again. The file is decoded in large blocks, not line by line.
+    """
+
+    def __init__(
+        self,
+        fileobject,
+        encoding: Optional[str] = None,
+        trace_fn: Optional[Callable] = None,
+        retention: SourceRetention = SourceRetention.FULL,
+    ):
+        """
+        :param fileobject: The source of the feeder, opened in binary mode.
+        :param encoding: The encoding of the file, if it is known.
+        """
+        head = b""
+        if encoding is None:
+            encoding, head = self.file_encoding(fileobject)
+        self.encoding = encoding
+        text_file = io.TextIOWrapper(
+            io.BufferedReader(_PrefixedReader(head, fileobject), DECODING_BLOCK_SIZE),
+            encoding,
+            newline=None,
+        )
+        super().__init__(text_file, trace_fn, retention)
+
+    @staticmethod
+    def file_encoding(fileobject) -> Tuple[str, bytes]:
+        """
+        Return the encoding of binary file ``fileobject``, and the bytes
+        read from it to find that out.
+        """
+        try:
+            path = osp.abspath(fileobject.name)
+            file_stat = os.fstat(fileobject.fileno())
+        except (AttributeError, OSError, TypeError, ValueError):
+            # The file has no path or is not on disk.
+            path = None
+        else:
+            mtime = file_stat.st_mtime_ns
+            if not stat.S_ISREG(file_stat.st_mode):
+                # For example, a pipe.
+                path = None
+        if path is not None:
+            detected = _detected_encodings.get(path)
+            if detected is not None and detected[0] == mtime:
+                return detected[1], b""
+
+        head = fileobject.read(DETECTION_BLOCK_SIZE)
+        encoding = detect_encoding(head)
+        if path is not None:
+            _detected_encodings[path] = (mtime, encoding)
+        return encoding, head
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental re-tokenization of source text that is being edited, for
+example in a notebook cell or an editor buffer.
+
+After an edit, scanning restarts at the start of the last token that
+ends before the edit, and stops as soon as it reaches the start of an
+old token after the edit in the same token-scanning mode. From there
+on, the new tokens are the old ones moved by the change in length.
+So the scanning work depends on the size of the edit, not the size of
+the text.
+
+Tokens are kept in chunks, with positions relative to an offset for
+their chunk. The offsets of the chunks, and the number of tokens
+before each, are kept as prefix sums in trees, so moving the tokens
+after an edit updates only the chunks that the edit changes.
+"""
+
+from bisect import bisect_left
+from typing import Iterable, List, Optional, Tuple
+
+from mathics_scanner.errors import SyntaxError
+from mathics_scanner.feed import SingleLineFeeder
+from mathics_scanner.location import ContainerKind
+from mathics_scanner.tokeniser import Token, Tokeniser
+
+# How far past the end of its text the scan of a token can look. For
+# example, "2^^" is scanned as the Number "2" followed by two Power
+# tokens, but "2^^1" is a single Number.
+LOOKAHEAD = 4
+
+# The number of tokens in a chunk when it is made. A chunk that grows to
+# more than twice this is split, and the old tokens left after an edit
+# in a chunk are kept in a chunk of their own unless there are fewer
+# than a quarter of this.
+CHUNK_SIZE = 256
+
+# A place in the list of chunks: the index of a chunk and the index of
+# a token in it. The place after the last token is (number of chunks, 0).
+Cursor = Tuple[int, int]
+
+
+class _SumTree:
+    """
+    Prefix sums of a list of ints, as a Fenwick tree: changing a value
+    and getting the sum of the values before an index both take a number
+    of steps logarithmic in the length.
+    """
+
+    __slots__ = ("tree",)
+
+    def __init__(self, values: Iterable[int]):
+        tree = [0]
+        tree.extend(values)
+        size = len(tree)
+        for i in range(1, size):
+            parent = i + (i & -i)
+            if parent < size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def add(self, index: int, delta: int) -> None:
+        tree = self.tree
+        index += 1
+        while index < len(tree):
+            tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """
+        Return the sum of the values before ``index``.
+        """
+        tree = self.tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, total: int) -> int:
+        """
+        Return the largest index whose prefix sum is at most ``total``.
+        All values must be positive.
+        """
+        tree = self.tree
+        index = 0
+        step = 1 << (len(tree).bit_length() - 1)
+        while step:
+            if index + step < len(tree) and tree[index + step] <= total:
+                index += step
+                total -= tree[index]
+            step >>= 1
+        return index
+
+
+class _Chunk:
+    """
+    A run of consecutive tokens, with the offsets where their text starts
+    and ends and the token-scanning mode each was scanned in. Token
+    positions and offsets are relative to the offset of the chunk.
+    """
+
+    __slots__ = ("tokens", "starts", "ends", "modes")
+
+    def __init__(
+        self,
+        tokens: List[Token],
+        starts: List[int],
+        ends: List[int],
+        modes: List[str],
+    ):
+        self.tokens = tokens
+        self.starts = starts
+        self.ends = ends
+        self.modes = modes
+
+    def slice(self, begin: int, end: Optional[int], shift: int) -> "_Chunk":
+        """
+        Return the tokens from index ``begin`` up to ``end``, with positions
+        moved by ``shift``.
+        """
+        tokens = self.tokens[begin:end]
+        starts = self.starts[begin:end]
+        ends = self.ends[begin:end]
+        if shift:
+            tokens = [
+                Token(token.tag, token.text, token.pos + shift) for token in tokens
+            ]
+            starts = [start + shift for start in starts]
+            ends = [end + shift for end in ends]
+        return _Chunk(tokens, starts, ends, self.modes[begin:end])
+
+    def extend(self, other: "_Chunk") -> None:
+        self.tokens += other.tokens
+        self.starts += other.starts
+        self.ends += other.ends
+        self.modes += other.modes
+
+
+class IncrementalTokeniser:
+    """
+    The tokens of some source text, kept up to date as the text is
+    edited with ``edit()``.
+
+    ``len()``, indexing and iteration give the tokens; ``tokens`` gives
+    them as a list. Along with each token, the offsets where its text
+    starts and ends are kept, and the token-scanning mode ("expr",
+    "filename" or "name-pattern") it was scanned in. Scanning is only
+    ever restarted at the start of a token, so a restart is never inside
+    a String or a comment. ``is_inside_box`` is used for all scanning.
+
+    The text is always the edited text, even when it cannot be scanned
+    to the end. Then ``error`` is the ``SyntaxError`` that scanning
+    stopped at, and the tokens are those before it; the text after them
+    is scanned again by the next edit that reaches it. Otherwise
+    ``error`` is None.
+    """
+
+    def __init__(
+        self,
+        source_text: str,
+        container: str = "<incremental>",
+        mode: str = "expr",
+        is_inside_box: bool = False,
+    ):
+        self.source_text = source_text
+        self.container = container
+        self.mode = mode
+        self.is_inside_box = is_inside_box
+
+        self._chunks: List[_Chunk] = []
+        # For each chunk, its offset less that of the chunk before it, and
+        # the number of its tokens; and the prefix sums of both.
+        self._gaps: List[int] = []
+        self._counts: List[int] = []
+        self._gap_sums = _SumTree(())
+        self._count_sums = _SumTree(())
+
+        end, new_chunk, self.error = self._scan(source_text, 0, mode, (0, 0), 0, 0)
+        self._splice((0, 0), end, new_chunk, 0)
+
+    def __len__(self) -> int:
+        return self._count_sums.prefix(len(self._chunks))
+
+    def __getitem__(self, index: int) -> Token:
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("token index out of range")
+        i = self._count_sums.find(index)
+        token = self._chunks[i].tokens[index - self._count_sums.prefix(i)]
+        return Token(token.tag, token.text, token.pos + self._offset(i))
+
+    def __iter__(self):
+        offset = 0
+        for chunk, gap in zip(self._chunks, self._gaps):
+            offset += gap
+            for token in chunk.tokens:
+                yield Token(token.tag, token.text, token.pos + offset)
+
+    @property
+    def tokens(self) -> List[Token]:
+        """
+        A list of all the tokens.
+        """
+        return list(self)
+
+    def _offset(self, i: int) -> int:
+        return self._gap_sums.prefix(i + 1)
+
+    def _index(self, cursor: Cursor) -> int:
+        return self._count_sums.prefix(cursor[0]) + cursor[1]
+
+    def _find(self, position: int, field: str) -> Cursor:
+        """
+        Return the place of the first token whose start, or end, is at or
+        after ``position``. ``field`` is "starts" or "ends".
+        """
+        chunks = self._chunks
+        i = bisect_left(
+            range(len(chunks)),
+            position,
+            key=lambda i: self._offset(i) + getattr(chunks[i], field)[-1],
+        )
+        if i == len(chunks):
+            return i, 0
+        return i, bisect_left(getattr(chunks[i], field), position - self._offset(i))
+
+    def _scan(
+        self,
+        source_text: str,
+        restart_pos: int,
+        mode: str,
+        realign: Cursor,
+        resync_pos: int,
+        delta: int,
+    ) -> Tuple[Cursor, _Chunk, Optional[SyntaxError]]:
+        """
+        Scan ``source_text`` from ``restart_pos`` in mode ``mode``.
+
+        Once scanning is at or after ``resync_pos``, it stops at the start
+        of an old token, from place ``realign`` on, that starts there after
+        being moved by ``delta`` and that was scanned in the same mode.
+        Return the place of that old token, the new tokens in a chunk
+        with offset 0, and None.
+
+        If scanning gets to the end of the text, or stops at a
+        ``SyntaxError``, the place returned is that after the last token,
+        along with the error, if any.
+        """
+        tokeniser = Tokeniser(
+            SingleLineFeeder(source_text, self.container, ContainerKind.STRING)
+        )
+        tokeniser.pos = restart_pos
+        tokeniser.change_token_scanning_mode(mode)
+        tokeniser.is_inside_box = self.is_inside_box
+
+        chunks = self._chunks
+        i, j = realign
+        if i < len(chunks):
+            offset = self._offset(i) + delta
+        new_chunk = _Chunk([], [], [], [])
+        spans = tokeniser.spans()
+        while True:
+            try:
+                token, start, end = next(spans)
+            except StopIteration:
+                return (len(chunks), 0), new_chunk, None
+            except SyntaxError as error:
+                return (len(chunks), 0), new_chunk, error
+            while i < len(chunks):
+                chunk = chunks[i]
+                old_start = chunk.starts[j] + offset
+                if old_start >= start:
+                    if (
+                        start >= resync_pos
+                        and old_start == start
+                        and chunk.modes[j] == mode
+                    ):
+                        # From here on, scanning gives the old tokens.
+                        return (i, j), new_chunk, None
+                    break
+                j += 1
+                if j == len(chunk.tokens):
+                    i, j = i + 1, 0
+                    offset += self._gaps[i] if i < len(chunks) else 0
+            new_chunk.tokens.append(token)
+            new_chunk.starts.append(start)
+            new_chunk.ends.append(end)
+            new_chunk.modes.append(mode)
+            mode = tokeniser.mode
+
+    def _splice(
+        self, first: Cursor, last: Cursor, new_chunk: _Chunk, delta: int
+    ) -> None:
+        """
+        Replace the tokens from place ``first`` up to ``last`` with those of
+        ``new_chunk``, and move the tokens after them by ``delta``.
+        """
+        chunks = self._chunks
+        first_i, first_j = first
+        last_i, last_j = last
+
+        # The tokens before the edit in the first chunk and the new tokens
+        # go into chunks with the offset of the first chunk, and so do the
+        # old tokens after the edit in the last chunk if it is the same
+        # chunk or they are few. Otherwise those keep a chunk of their own.
+        if first_i < len(chunks):
+            offset = self._offset(first_i)
+            middle = chunks[first_i].slice(0, first_j, 0)
+        else:
+            offset = 0
+            middle = _Chunk([], [], [], [])
+        middle.extend(new_chunk.slice(0, None, -offset))
+
+        tail_offset = 0
+        tail = None
+        end_i = last_i
+        if last_i < len(chunks):
+            end_i = last_i + 1
+            chunk = chunks[last_i]
+            tail_offset = self._offset(last_i) + delta
+            if last_i == first_i or len(chunk.tokens) - last_j < CHUNK_SIZE // 4:
+                middle.extend(chunk.slice(last_j, None, tail_offset - offset))
+            else:
+                tail = chunk.slice(last_j, None, 0)
+
+        size = len(middle.tokens)
+        if size > 2 * CHUNK_SIZE:
+            pieces = -(-size // CHUNK_SIZE)
+            bounds = [size * k // pieces for k in range(pieces + 1)]
+            replaced = [
+                middle.slice(begin, end, 0) for begin, end in zip(bounds, bounds[1:])
+            ]
+        else:
+            replaced = [middle] if size else []
+        previous = self._offset(first_i - 1) if first_i > 0 else 0
+        gaps = [offset - previous] + [0] * (len(replaced) - 1) if replaced else []
+        if tail is not None:
+            replaced.append(tail)
+            gaps.append(tail_offset - (offset if len(replaced) > 1 else previous))
+            previous = tail_offset
+        elif replaced:
+            previous = offset
+        counts = [len(chunk.tokens) for chunk in replaced]
+
+        # The chunk after the replaced ones moves by ``delta``.
+        if end_i < len(chunks):
+            gaps.append(self._offset(end_i) + delta - previous)
+            counts.append(self._counts[end_i])
+            end = end_i + 1
+        else:
+            end = end_i
+
+        chunks[first_i:end_i] = replaced
+        if end - first_i == len(gaps):
+            # The same number of chunks: update the sums.
+            for k, (gap, count) in enumerate(zip(gaps, counts), first_i):
+                self._gap_sums.add(k, gap - self._gaps[k])
+                self._count_sums.add(k, count - self._counts[k])
+                self._gaps[k] = gap
+                self._counts[k] = count
+        else:
+            self._gaps[first_i:end] = gaps
+            self._counts[first_i:end] = counts
+            self._gap_sums = _SumTree(self._gaps)
+            self._count_sums = _SumTree(self._counts)
+
+    def edit(
+        self, offset: int, deleted: int, inserted: str
+    ) -> Tuple[int, int, List[Token]]:
+        """
+        Replace the ``deleted`` characters of the source text at ``offset``
+        with ``inserted``, and re-scan the part of the text that this
+        affects.
+
+        Return ``(first, last, new_tokens)``: the tokens that were at
+        indices ``first`` up to ``last`` have been replaced by
+        ``new_tokens``. Tokens after those have been moved by the change
+        in length.
+
+        The edit is made even if scanning stops at a ``SyntaxError``; see
+        ``error``.
+        """
+        source_text = self.source_text
+        if not (0 <= offset and offset + deleted <= len(source_text)):
+            raise ValueError(
+                f"edit at {offset} of {deleted} characters is outside of "
+                f"text of length {len(source_text)}"
+            )
+        new_source_text = (
+            source_text[:offset] + inserted + source_text[offset + deleted :]
+        )
+        delta = len(inserted) - deleted
+
+        # Restart at the last token that ends before the edit, far enough
+        # before it that the edit cannot change how that token was
+        # scanned. Blank space after a token is scanned again too: after
+        # "=", it can be part of an Unset.
+        i, j = self._find(offset - LOOKAHEAD, "ends")
+        if j > 0:
+            j -= 1
+        elif i > 0:
+            i -= 1
+            j = len(self._chunks[i].tokens) - 1
+        if (i, j) == (0, 0) or not self._chunks:
+            restart_pos = 0
+            mode = self.mode
+        else:
+            restart_pos = self._chunks[i].starts[j] + self._offset(i)
+            mode = self._chunks[i].modes[j]
+        first = self._index((i, j))
+
+        # Scanning can realign with an old token that starts after the
+        # deleted text, once it is past the inserted text. The text from
+        # there on is the same as before the edit.
+        last_cursor, new_chunk, error = self._scan(
+            new_source_text,
+            restart_pos,
+            mode,
+            self._find(offset + deleted, "starts"),
+            offset + len(inserted),
+            delta,
+        )
+        last = self._index(last_cursor)
+        if last_cursor == (len(self._chunks), 0):
+            # The text after the edit has been scanned to its end, or to an
+            # error. Otherwise, it is as it was, and so is any error in it.
+            self.error = error
+        self._splice((i, j), last_cursor, new_chunk, delta)
+        self.source_text = new_source_text
+        return first, last, new_chunk.tokens
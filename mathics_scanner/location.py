@@ -1,6 +1,10 @@
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 from enum import Enum
 from types import MethodType
-from typing import List, NamedTuple, Set, Tuple, Union
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, Union
 
 
 class ContainerKind(Enum):
@@ -33,6 +37,223 @@ class SourceRange2(NamedTuple):
     container: int
 
 
+# A location can also be packed into a single int of 64 bits, which
+# takes much less memory than a SourceRange and can be kept in an
+# array("Q"). It holds the container, line and column of the start of
+# a range. From the lowest bits up, the fields are:
+PACKED_COLUMN_BITS = 16
+PACKED_LINE_BITS = 28
+PACKED_CONTAINER_BITS = 20
+
+# Columns past the largest that fits are packed as that largest column.
+PACKED_COLUMN_MAX = (1 << PACKED_COLUMN_BITS) - 1
+_PACKED_LINE_SHIFT = PACKED_COLUMN_BITS
+_PACKED_CONTAINER_SHIFT = PACKED_COLUMN_BITS + PACKED_LINE_BITS
+
+
+def pack_location(container: int, line: int, column: int) -> int:
+    """
+    Return the packed location of column ``column`` of line ``line`` in
+    container ``container``, all 0 origin.
+    """
+    if not 0 <= container < 1 << PACKED_CONTAINER_BITS:
+        raise ValueError(f"container {container} cannot be packed")
+    if not 0 <= line < 1 << PACKED_LINE_BITS:
+        raise ValueError(f"line {line} cannot be packed")
+    if column < 0:
+        raise ValueError(f"column {column} cannot be packed")
+    if column > PACKED_COLUMN_MAX:
+        column = PACKED_COLUMN_MAX
+    return (
+        (container << _PACKED_CONTAINER_SHIFT) | (line << _PACKED_LINE_SHIFT) | column
+    )
+
+
+def pack_source_range(loc: Union[SourceRange, SourceRange2]) -> int:
+    "Return the packed location of the start of ``loc``"
+    return pack_location(loc.container, loc.start_line, loc.start_pos)
+
+
+def packed_container(loc: int) -> int:
+    "Return the container of packed location ``loc``"
+    return loc >> _PACKED_CONTAINER_SHIFT
+
+
+def packed_line(loc: int) -> int:
+    "Return the line of packed location ``loc``"
+    return (loc >> _PACKED_LINE_SHIFT) & ((1 << PACKED_LINE_BITS) - 1)
+
+
+def packed_column(loc: int) -> int:
+    "Return the column of packed location ``loc``"
+    return loc & PACKED_COLUMN_MAX
+
+
+def unpack_location(loc: int) -> Tuple[int, int, int]:
+    "Return the container, line and column of packed location ``loc``"
+    return packed_container(loc), packed_line(loc), packed_column(loc)
+
+
+class LineStarts:
+    """
+    The offsets at which the lines of some text start, and their line
+    numbers, built up as the text is read. These are used to convert
+    an offset into the text, like ``Token.pos``, into a line and column.
+
+    Line numbers and columns are 0 origin, as in ``SourceRange``.
+
+    The starts of lines before a given one can be discarded with
+    ``discard()``, for text that is not kept either.
+    """
+
+    def __init__(self):
+        # Kept in arrays rather than lists, since there is an entry
+        # for every line read.
+        self.starts = array("q")
+        self.line_numbers = array("q")
+        self.length = 0
+
+        # The index of the first entry kept, and the offset before which
+        # positions have been discarded. Discarded entries are removed
+        # from the arrays once they are at least half of them.
+        self.first = 0
+        self.start = 0
+
+    def add(self, text: str, line_number: int) -> None:
+        """
+        Add ``text``, which starts line ``line_number``, to the end of the
+        text. ``text`` can hold several lines.
+        """
+        length = self.length
+        self.length = length + len(text)
+        self.starts.append(length)
+        self.line_numbers.append(line_number)
+        newline = text.find("\n", 0, -1)
+        while newline != -1:
+            line_number += 1
+            self.starts.append(length + newline + 1)
+            self.line_numbers.append(line_number)
+            newline = text.find("\n", newline + 1, -1)
+
+    @property
+    def last_start(self) -> int:
+        "The offset where the last line added starts"
+        return self.starts[-1] if self.starts else 0
+
+    def discard(self, offset: int) -> None:
+        """
+        Forget where the lines before the line that offset ``offset`` is in
+        start. Positions before that line can no longer be converted.
+        """
+        starts = self.starts
+        index = bisect_right(starts, offset, self.first) - 1
+        if index <= self.first:
+            return
+        self.start = starts[index]
+        if index >= len(starts) // 2:
+            del starts[:index]
+            del self.line_numbers[:index]
+            index = 0
+        self.first = index
+
+    def position_to_line_col(self, pos: int) -> Tuple[int, int]:
+        "Return the line number and column of offset ``pos``"
+        if pos < self.start:
+            raise ValueError(f"the line of position {pos} has been discarded")
+        index = bisect_right(self.starts, pos, self.first) - 1
+        if index < self.first:
+            return 0, pos
+        return self.line_numbers[index], pos - self.starts[index]
+
+    def source_range(self, start_pos: int, end_pos: int, container: int) -> SourceRange:
+        """
+        Return the ``SourceRange`` from offset ``start_pos`` up to offset
+        ``end_pos`` in container ``container``.
+        """
+        start_line, start_column = self.position_to_line_col(start_pos)
+        end_line, end_column = self.position_to_line_col(end_pos)
+        return SourceRange(start_line, start_column, end_line, end_column, container)
+
+    def packed_location(self, pos: int, container: int) -> int:
+        "Return the packed location of offset ``pos`` in container ``container``"
+        line, column = self.position_to_line_col(pos)
+        return pack_location(container, line, column)
+
+
+class ContainerRegistry:
+    """
+    Short integer ids for containers, such as file paths, so that
+    locations can refer to a container by its id. ``paths`` is the list
+    of containers by id, which the registry adds to.
+
+    STREAM and STRING containers are usually read once, so at most
+    ``max_transient`` of them are kept, the least recently registered
+    being forgotten first; ``None`` means no limit. The id of a container
+    that has been forgotten is not given to another container, so that
+    old locations do not refer to the wrong one; its entry in ``paths``
+    becomes None.
+
+    So ids keep growing with each distinct container registered, even
+    though at most ``max_transient`` transient ones are kept. A packed
+    location has ``PACKED_CONTAINER_BITS`` bits for the id, and
+    ``pack_location()`` raises ValueError for ids from
+    ``1 << PACKED_CONTAINER_BITS``, about a million, on. Registering a
+    name again, such as "<stdin>" for each input, reuses its id.
+
+    Registering is thread-safe.
+    """
+
+    def __init__(self, paths: List[Optional[str]], max_transient: Optional[int] = None):
+        self.paths = paths
+        self.ids: Dict[str, int] = {
+            path: container_id
+            for container_id, path in enumerate(paths)
+            if path is not None
+        }
+        self.max_transient = max_transient
+
+        # The ids of STREAM and STRING containers, least recently
+        # registered first.
+        self.transient: "OrderedDict[str, int]" = OrderedDict()
+
+        self.lock = threading.Lock()
+
+    def register(self, container: str, kind: ContainerKind = ContainerKind.FILE) -> int:
+        "Return the id of ``container``, registering it if it is new"
+        container_id = self.ids.get(container)
+        if container_id is not None and container not in self.transient:
+            return container_id
+
+        with self.lock:
+            container_id = self.ids.get(container)
+            if container_id is None:
+                container_id = len(self.paths)
+                self.paths.append(container)
+                self.ids[container] = container_id
+                if kind in (ContainerKind.STREAM, ContainerKind.STRING):
+                    self.transient[container] = container_id
+                    self._evict()
+            elif container in self.transient:
+                self.transient.move_to_end(container)
+            return container_id
+
+    def _evict(self) -> None:
+        "Forget the least recently registered transient containers over the limit"
+        if self.max_transient is None:
+            return
+        while len(self.transient) > self.max_transient:
+            container, container_id = self.transient.popitem(last=False)
+            del self.ids[container]
+            self.paths[container_id] = None
+
+    def path(self, container_id: int) -> Optional[str]:
+        "Return the container with id ``container_id``, or None if it was forgotten"
+        return self.paths[container_id]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
 # True if we want to keep track of positions as we scan an parse.
 # This can be useful in debugging. It can also add a lot memory in
 # saving position information.
@@ -42,7 +263,15 @@ TRACK_LOCATIONS: bool = False
 # representation of the file path.
 # For example:
 #   ["mathics/autoload/rules/Bessel.m", "mathics/autoload/rules/Element.m", ... ]
-MATHICS3_PATHS: List[str] = []
+MATHICS3_PATHS: List[Optional[str]] = []
+
+# The largest number of STREAM and STRING containers kept in
+# MATHICS3_PATHS.
+MAX_TRANSIENT_CONTAINERS = 1024
+
+# Containers are added to MATHICS3_PATHS by registering them here, which
+# finds the index of a container seen before in constant time.
+CONTAINERS = ContainerRegistry(MATHICS3_PATHS, max_transient=MAX_TRANSIENT_CONTAINERS)
 
 # Set of Mathics3 Builtin evaluation methods seen.
 EVAL_METHODS: Set[MethodType] = set([])
@@ -63,17 +292,21 @@ def get_location(loc: Union[SourceRange, SourceRange2, MethodType]) -> str:
 
 
 def get_location_file_line(
-    loc: Union[SourceRange, SourceRange2, MethodType],
-) -> Tuple[str, int]:
+    loc: Union[SourceRange, SourceRange2, MethodType, int],
+) -> Tuple[Optional[str], int]:
     """
     Return the container name (often a filename) and starting line number for
-    a location ``loc``.
+    a location ``loc``, which can be a packed location. The name is None if
+    the container is a STREAM or STRING one that has since been forgotten.
     """
     if isinstance(loc, MethodType):
         func = loc.__func__
         code = func.__code__
         filename = code.co_filename
         line_number = code.co_firstlineno
+    elif isinstance(loc, int):
+        filename = MATHICS3_PATHS[packed_container(loc)]
+        line_number = packed_line(loc)
     else:
         filename = MATHICS3_PATHS[loc.container]
         line_number = loc.start_line
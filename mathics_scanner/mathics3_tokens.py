@@ -16,7 +16,7 @@ from mathics_scanner.errors import (
 )
 from mathics_scanner.feed import FileLineFeeder, LineFeeder, SingleLineFeeder
 from mathics_scanner.location import ContainerKind
-from mathics_scanner.tokeniser import Tokeniser
+from mathics_scanner.tokeniser import Token, Tokeniser
 from mathics_scanner.version import __version__
 
 
@@ -216,7 +216,9 @@ def tokens(shell: TerminalShell, source_text: str, code_tokenize_format: bool):
             )
         else:
             mess = shell.get_out_prompt()
-            token.text = replace_box_unicode_with_ascii(token.text)
+            token = Token(
+                token.tag, replace_box_unicode_with_ascii(token.text), token.pos
+            )
             print(mess + str(token) + "\n")
 
 
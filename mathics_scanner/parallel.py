@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Tokenization of many files at once, spread over a pool of processes.
+
+Each file is tokenized independently, so loading a large package
+tree can use all of the cores available rather than just one. The
+tokens are sent back from each process packed into columns, rather
+than as a Token object each.
+"""
+
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from mathics_scanner.errors import SyntaxError
+from mathics_scanner.feed import EncodingDetectingFileLineFeeder
+from mathics_scanner.token_cache import (
+    PackedTokens,
+    TokenCache,
+    pack_tokens,
+    unpack_tokens,
+)
+from mathics_scanner.tokeniser import Token, Tokeniser
+
+
+class FileTokens(NamedTuple):
+    """The result of tokenizing a file with ``tokenize_files()``"""
+
+    path: str
+
+    # The tokens scanned, up to an error if there is one.
+    tokens: List[Token]
+
+    # The messages left in the file's feeder.
+    messages: List[list]
+
+    # The error that stopped scanning, if any: a SyntaxError, or an
+    # OSError or UnicodeDecodeError from reading the file.
+    error: Optional[Exception]
+
+
+def tokenize_file(path: str, cache: Optional[TokenCache] = None) -> FileTokens:
+    """
+    Tokenize all of the file at ``path``, and return the tokens together
+    with the messages from scanning it.
+
+    If ``cache`` is given, the result is taken from there when the file
+    has been scanned before, and otherwise it is saved there.
+
+    A file that cannot be read or decoded gives the error in the result
+    rather than raising it, as a ``SyntaxError`` does.
+    """
+    try:
+        if cache is None:
+            with open(path, "rb") as fileobject:
+                return _tokenize_fileobject(path, fileobject)
+
+        with open(path, "rb") as fileobject:
+            content = fileobject.read()
+    except OSError as os_error:
+        return FileTokens(path, [], [], os_error)
+    key = cache.key(path, content)
+    cached = cache.load(key)
+    if cached is not None:
+        return FileTokens(path, *cached)
+
+    # Scan the contents read, which may no longer be what is in the file.
+    fileobject = io.BytesIO(content)
+    fileobject.name = path
+    result = _tokenize_fileobject(path, fileobject)
+    if result.error is not None and not isinstance(result.error, SyntaxError):
+        # Only scanning results are cached, not failures to decode.
+        return result
+    try:
+        cache.store(key, result.tokens, result.messages, result.error)
+    except OSError:
+        # A cache that cannot be written to just does not speed things up.
+        pass
+    return result
+
+
+def _tokenize_fileobject(path: str, fileobject) -> FileTokens:
+    "Tokenize the open binary file ``fileobject`` for the file at ``path``"
+    tokens: List[Token] = []
+    messages: List[list] = []
+    error: Optional[Exception] = None
+    try:
+        feeder = EncodingDetectingFileLineFeeder(fileobject)
+        messages = feeder.messages
+        tokens.extend(Tokeniser(feeder))
+    except SyntaxError as syntax_error:
+        error = syntax_error
+    except (OSError, UnicodeDecodeError) as read_error:
+        # Keep the tokens scanned before the file could not be read.
+        error = read_error
+    return FileTokens(path, tokens, messages, error)
+
+
+def _tokenize_file_packed(
+    path: str, cache: Optional[TokenCache]
+) -> Tuple[PackedTokens, List[list], Optional[Exception]]:
+    "Run ``tokenize_file()`` in a worker process, packing the tokens"
+    result = tokenize_file(path, cache)
+    return pack_tokens(result.tokens), result.messages, result.error
+
+
+def tokenize_files(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    cache: Optional[TokenCache] = None,
+) -> List[FileTokens]:
+    """
+    Tokenize the files at ``paths`` in ``workers`` processes, or as many
+    processes as there are CPUs if ``workers`` is not given. Return the
+    results in the order of ``paths``.
+
+    With a single worker, or a single file, or where processes cannot be
+    started, as under Pyodide, files are tokenized in this process.
+    ``cache`` is used as in ``tokenize_file()``.
+    """
+    paths = list(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(paths) <= 1 or sys.platform == "emscripten":
+        return [tokenize_file(path, cache) for path in paths]
+
+    # Hand out files a few at a time, so that the cost of sending work to
+    # a process is spread over several files.
+    chunksize = max(1, len(paths) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            _tokenize_file_packed, paths, [cache] * len(paths), chunksize=chunksize
+        )
+        return [
+            FileTokens(path, unpack_tokens(packed), messages, error)
+            for path, (packed, messages, error) in zip(paths, results)
+        ]
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Source text kept as a list of segments, usually lines, rather than
+as one string.
+
+Appending a line to a string copies everything before it, so building
+up the text of a long multi-line input one line at a time takes time
+quadratic in its length. A ``SourceBuffer`` appends in constant time
+and keeps the offset at which each segment starts, so that text can
+still be found by its offset in the whole input.
+
+Segments at the start that are no longer needed can be discarded; the
+offsets of the remaining text do not change.
+"""
+
+from bisect import bisect_right
+from typing import List, Optional
+
+
+class SourceBuffer:
+    """
+    A sequence of source-text segments together with the offset at
+    which each segment starts in the text as a whole.
+    """
+
+    def __init__(self, source_text: str = ""):
+        # The segments, and the offset at which each one starts.
+        self.segments: List[str] = []
+        self.starts: List[int] = []
+        self.length = 0
+
+        # The offset of the first segment kept; text before it has been
+        # discarded.
+        self.start = 0
+
+        # The segments joined, once this has been asked for.
+        self._joined: Optional[str] = None
+
+        if source_text:
+            self.append(source_text)
+
+    def append(self, segment: str) -> None:
+        "Add ``segment`` to the end of the text"
+        self.segments.append(segment)
+        self.starts.append(self.length)
+        self.length += len(segment)
+        self._joined = None
+
+    def discard(self, offset: int) -> None:
+        """
+        Discard the segments which end at or before ``offset``. Offsets
+        of the text after them stay the same.
+        """
+        starts = self.starts
+        # Segment i ends where segment i + 1 starts.
+        count = bisect_right(starts, offset, 1) - 1
+        if offset >= self.length:
+            count = len(starts)
+        if count > 0:
+            del self.segments[:count]
+            del starts[:count]
+            self.start = starts[0] if starts else self.length
+            self._joined = None
+
+    def segment_index(self, offset: int) -> int:
+        "Return the index of the segment which contains ``offset``"
+        return max(bisect_right(self.starts, offset) - 1, 0)
+
+    def text(self, start: int = 0, end: Optional[int] = None) -> str:
+        """
+        Return the text from offset ``start`` up to offset ``end``, or to
+        the end of the text if ``end`` is not given. Text that has been
+        discarded is left out.
+        """
+        if end is None or end > self.length:
+            end = self.length
+        if start < self.start:
+            start = self.start
+        if start >= end:
+            return ""
+        if self._joined is not None:
+            return self._joined[start - self.start : end - self.start]
+
+        first = self.segment_index(start)
+        last = self.segment_index(end - 1)
+        if first == last:
+            segment_start = self.starts[first]
+            return self.segments[first][start - segment_start : end - segment_start]
+        pieces = self.segments[first : last + 1]
+        pieces[0] = pieces[0][start - self.starts[first] :]
+        pieces[-1] = pieces[-1][: end - self.starts[last]]
+        return "".join(pieces)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __str__(self) -> str:
+        if self._joined is None:
+            self._joined = "".join(self.segments)
+        return self._joined
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+A compact, column-oriented store for a stream of tokens.
+
+A list of ``Token`` objects costs a Python object per token. Here, a
+token is a row in three integer arrays: a tag id, and the starting
+and ending offsets of the token in the source text it was scanned
+from. Token text is sliced out of the source text only when it is
+asked for.
+"""
+
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+from mathics_scanner.tokeniser import StreamingTokeniser, Token, Tokeniser
+
+
+class TokenBuffer:
+    """
+    A sequence of tokens stored in columns next to the source text they
+    were scanned from.
+
+    Use ``tag()``, ``text()``, ``start()`` and ``end()`` to look at the
+    token at some index without creating a ``Token``. Indexing, as in
+    ``buffer[i]``, creates a ``Token``, which is the same as the one the
+    tokeniser gave; in particular, the position of a String token is
+    where it ends rather than where it starts.
+    """
+
+    def __init__(self, source_text: str = ""):
+        self.source_text = source_text
+
+        # The columns. Offsets use 64-bit integers since the source text
+        # of a large generated data file can be more than 2GB.
+        self.tag_ids = array("i")
+        self.starts = array("q")
+        self.ends = array("q")
+
+        # The names of tags seen, indexed by tag id, and the reverse mapping.
+        self.tag_names: List[str] = []
+        self._tag_ids: Dict[str, int] = {}
+
+        # Text of tokens, keyed by token index, whose text is not a slice
+        # of the source text. For example, escape sequences in a String
+        # or in a Symbol have been replaced.
+        self._texts: Dict[int, str] = {}
+
+    @classmethod
+    def from_tokeniser(cls, tokeniser: Tokeniser) -> "TokenBuffer":
+        """
+        Scan everything the feeder of ``tokeniser`` has to give,
+        and return the tokens found in a ``TokenBuffer``.
+
+        The text of the tokens is sliced from all of the source text, so
+        ``tokeniser`` cannot be a ``StreamingTokeniser``, which discards
+        the text it has scanned.
+        """
+        if isinstance(tokeniser, StreamingTokeniser):
+            raise ValueError(
+                "a TokenBuffer needs all of the source text, "
+                "which a StreamingTokeniser discards"
+            )
+        buffer = cls()
+        append_row = buffer._append_row
+        source_buffer = tokeniser.source_buffer
+        for token, start, end in tokeniser.spans():
+            text = token.text
+            if len(text) != end - start:
+                append_row(token.tag, start, end, text)
+                continue
+
+            # The tokeniser only has the text it is still scanning in
+            # source_text; this starts at offset source_offset. Input read
+            # while scanning a token moves that offset past its start.
+            local_start = start - tokeniser.source_offset
+            if local_start >= 0:
+                is_slice = tokeniser.source_text.startswith(text, local_start)
+            else:
+                is_slice = source_buffer.text(start, end) == text
+            append_row(token.tag, start, end, None if is_slice else text)
+        buffer.source_text = str(source_buffer)
+        return buffer
+
+    def append(
+        self, token: Token, end: Optional[int] = None, start: Optional[int] = None
+    ) -> None:
+        """
+        Add ``token`` to the end of the buffer. ``start`` and ``end`` are
+        the offsets of the start of the source text of the token and just
+        after it, as given by ``Tokeniser.spans()``. They are only needed
+        when ``token.text`` is not the source text at ``token.pos``, or for
+        a String, the source text ending there; otherwise ``ValueError``
+        is raised.
+        """
+        text = token.text
+        if start is None:
+            start = token.pos
+            if token.tag == "String":
+                # The position of a String is where it ends, which only
+                # gives its start when its text is its source text.
+                start -= len(text)
+                if not self.source_text.startswith(text, start):
+                    raise ValueError(
+                        f"the start of String {text!r} must be given, since "
+                        "its text is not the source text ending at "
+                        f"{token.pos}"
+                    )
+        if self.source_text.startswith(text, start):
+            self._append_row(token.tag, start, start + len(text), None)
+        elif end is None:
+            raise ValueError(
+                f"the end of {token.tag} {text!r} must be given, since its "
+                f"text is not the source text at {start}"
+            )
+        else:
+            self._append_row(token.tag, start, end, text)
+
+    def _append_row(self, tag: str, start: int, end: int, text: Optional[str]):
+        """
+        Add a row for a token to the columns. ``text`` is the text of the
+        token if it is not the source text from ``start`` to ``end``.
+        """
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tag_names)
+            self.tag_names.append(tag)
+            self._tag_ids[tag] = tag_id
+
+        self.tag_ids.append(tag_id)
+        self.starts.append(start)
+        self.ends.append(end)
+        if text is not None:
+            self._texts[len(self.starts) - 1] = text
+
+    def _index(self, index: int) -> int:
+        """Return ``index`` as a non-negative index, checking its range"""
+        length = len(self.tag_ids)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("TokenBuffer index out of range")
+        return index
+
+    def end(self, index: int) -> int:
+        "Return the offset just after the source text of the token at ``index``"
+        return self.ends[index]
+
+    def start(self, index: int) -> int:
+        "Return the starting offset of the token at ``index``"
+        return self.starts[index]
+
+    def tag(self, index: int) -> str:
+        "Return the tag of the token at ``index``"
+        return self.tag_names[self.tag_ids[index]]
+
+    def text(self, index: int) -> str:
+        "Return the text of the token at ``index``"
+        index = self._index(index)
+        text = self._texts.get(index)
+        if text is None:
+            text = self.source_text[self.starts[index] : self.ends[index]]
+        return text
+
+    def __getitem__(self, index: int) -> Token:
+        index = self._index(index)
+        tag = self.tag(index)
+        # The tokeniser gives the position of a String as where it ends.
+        pos = self.ends[index] if tag == "String" else self.starts[index]
+        return Token(tag, self.text(index), pos)
+
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(len(self.tag_ids)):
+            yield self[index]
+
+    def __len__(self) -> int:
+        return len(self.tag_ids)
+
+    def __repr__(self) -> str:
+        return f"<TokenBuffer: {len(self)} tokens>"
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+An on-disk cache of the tokens of source files, in the spirit of
+Python's ``.pyc`` files.
+
+An entry is found by a hash of the file path and contents, the
+scanner version, and the contents of the JSON tables that scanning
+depends on. So an entry is never out of date: a change to any of
+these gives a different key. Entries are written to a temporary file
+which is then renamed, so processes sharing a cache directory never
+see a partly-written entry.
+"""
+
+import hashlib
+import marshal
+import os
+import os.path as osp
+import tempfile
+from array import array
+from typing import List, Optional, Tuple
+
+from mathics_scanner import errors
+from mathics_scanner.characters import (
+    BOXING_CHARACTERS_PATH,
+    NAMED_CHARACTERS_PATH,
+    OPERATORS_TABLE_PATH,
+)
+from mathics_scanner.tokeniser import Token
+from mathics_scanner.version import __version__
+
+# Changed whenever the layout of a cache entry changes.
+CACHE_FORMAT_VERSION = 1
+
+CACHE_ENTRY_SUFFIX = ".tokens"
+
+# Tokens as columns, as made by pack_tokens(): the distinct tags, and
+# for each token the index of its tag, its position and its text.
+PackedTokens = Tuple[Tuple[str, ...], bytes, bytes, Tuple[str, ...]]
+
+# The hash of everything other than a file that its tokens depend on.
+# See scanner_hash().
+_scanner_hash: Optional[bytes] = None
+
+
+def scanner_hash() -> bytes:
+    """
+    Return a hash of the scanner version and the JSON tables the
+    scanner is built from.
+    """
+    global _scanner_hash
+    if _scanner_hash is None:
+        digest = hashlib.sha256()
+        digest.update(
+            f"{__version__}\0{CACHE_FORMAT_VERSION}\0{marshal.version}\0".encode()
+        )
+        for table_path in (
+            OPERATORS_TABLE_PATH,
+            NAMED_CHARACTERS_PATH,
+            BOXING_CHARACTERS_PATH,
+        ):
+            if osp.exists(table_path):
+                with open(table_path, "rb") as table_file:
+                    digest.update(table_file.read())
+            digest.update(b"\0")
+        _scanner_hash = digest.digest()
+    return _scanner_hash
+
+
+def pack_tokens(tokens: List[Token]) -> PackedTokens:
+    """
+    Return ``tokens`` as columns: the distinct tags, the index of the tag
+    of each token as an array of 16-bit ints, the positions as an array
+    of 64-bit ints, and the texts. The arrays are given as bytes.
+    """
+    tag_names: List[str] = []
+    tag_id_map = {}
+    tag_ids = array("H")
+    for token in tokens:
+        tag_id = tag_id_map.get(token.tag)
+        if tag_id is None:
+            tag_id = tag_id_map[token.tag] = len(tag_names)
+            tag_names.append(token.tag)
+        tag_ids.append(tag_id)
+    return (
+        tuple(tag_names),
+        tag_ids.tobytes(),
+        array("q", [token.pos for token in tokens]).tobytes(),
+        tuple(token.text for token in tokens),
+    )
+
+
+def unpack_tokens(packed: PackedTokens) -> List[Token]:
+    "Return the tokens packed into columns by ``pack_tokens()``"
+    tag_names, tag_id_bytes, pos_bytes, texts = packed
+    tag_ids = array("H")
+    tag_ids.frombytes(tag_id_bytes)
+    positions = array("q")
+    positions.frombytes(pos_bytes)
+    return [
+        Token(tag_names[tag_id], text, pos)
+        for tag_id, text, pos in zip(tag_ids, texts, positions)
+    ]
+
+
+class TokenCache:
+    """
+    A directory of cached tokens and messages from scanning files.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def key(self, path: str, content: bytes) -> str:
+        """
+        Return the key of the entry for the file at ``path`` with
+        contents ``content``.
+        """
+        digest = hashlib.sha256(scanner_hash())
+        digest.update(osp.abspath(path).encode("utf-8", "surrogateescape"))
+        digest.update(b"\0")
+        digest.update(content)
+        return digest.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        "Return the path of the cache entry with key ``key``"
+        return osp.join(self.directory, key + CACHE_ENTRY_SUFFIX)
+
+    def load(
+        self, key: str
+    ) -> Optional[Tuple[List[Token], List[list], Optional[errors.SyntaxError]]]:
+        """
+        Return the tokens, messages and error for the entry with key
+        ``key``, or None if there is no such entry or it cannot be read.
+        """
+        try:
+            with open(self.entry_path(key), "rb") as entry_file:
+                entry = marshal.load(entry_file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not (isinstance(entry, tuple) and entry[0] == CACHE_FORMAT_VERSION):
+            return None
+
+        tokens = unpack_tokens(entry[1:5])
+        messages, error = entry[5:]
+        if error is not None:
+            error_class_name, tag, args = error
+            error = getattr(errors, error_class_name)(tag, *args)
+        return tokens, messages, error
+
+    def store(
+        self,
+        key: str,
+        tokens: List[Token],
+        messages: List[list],
+        error: Optional[errors.SyntaxError] = None,
+    ) -> None:
+        """
+        Save ``tokens``, ``messages`` and ``error`` from scanning a file as
+        the entry with key ``key``.
+        """
+        entry = (
+            CACHE_FORMAT_VERSION,
+            *pack_tokens(tokens),
+            [list(message) for message in messages],
+            (
+                None
+                if error is None
+                else (type(error).__name__, error.tag, tuple(error.args))
+            ),
+        )
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.directory, suffix=CACHE_ENTRY_SUFFIX + ".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as entry_file:
+                marshal.dump(entry, entry_file)
+            os.replace(temp_path, self.entry_path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
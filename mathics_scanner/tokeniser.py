@@ -8,7 +8,19 @@ See classes `Token` and `Tokeniser`.
 import itertools
 import re
 import string
-from typing import Dict, Final, List, Optional, Set, Tuple
+from operator import attrgetter
+from sys import intern
+from typing import (
+    Callable,
+    Dict,
+    Final,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from mathics_scanner.characters import (
     LETTERLIKES,
@@ -25,7 +37,13 @@ from mathics_scanner.errors import (
     NamedCharacterSyntaxError,
     SyntaxError,
 )
-from mathics_scanner.escape_sequences import parse_escape_sequence
+from mathics_scanner.escape_sequences import (
+    SINGLE_CHARACTER_ESCAPES,
+    parse_escape_sequence,
+)
+from mathics_scanner.feed import SingleLineFeeder, SourceRetention
+from mathics_scanner.location import ContainerKind, LineStarts, SourceRange
+from mathics_scanner.source_buffer import SourceBuffer
 
 #####################################################
 # The below get (re)initialized in by init_module()
@@ -58,6 +76,13 @@ NAME_PATTERN_TOKENS: List = []
 TOKENS: List[Tuple] = []
 TOKEN_INDICES: Dict = {}
 
+# Combined patterns for each token-scanning mode, keyed by the leading
+# character of a token. See compile_dispatch(). These are also
+# initialized in init_module().
+FILENAME_DISPATCH: Dict[str, re.Pattern] = {}
+NAME_PATTERN_DISPATCH: Dict[str, re.Pattern] = {}
+TOKEN_DISPATCH: Dict[str, re.Pattern] = {}
+
 ##############################################
 # special patterns
 NUMBER_PATTERN = r"""
@@ -69,6 +94,14 @@ NUMBER_PATTERN = r"""
 (\*\^(\+|-)?\d+)?                           (?# Exponent)
 """
 
+# Most numbers are plain integers or decimals. A number starting with
+# a digit is matched with the much simpler PLAIN_NUMBER_RE first, and
+# then again with NUMBER_RE only if it is followed by text that can
+# continue it with a base, a precision or accuracy, or an exponent.
+NUMBER_RE: Final[re.Pattern] = re.compile(NUMBER_PATTERN, re.VERBOSE)
+PLAIN_NUMBER_RE: Final[re.Pattern] = re.compile(r"(?P<Number>\d+(?:\.\d*)?)")
+NUMBER_CONTINUATIONS: Final[Tuple[str, ...]] = ("^^", "`", "*^")
+
 # The additional characters that can appear as metacharacters in
 # the Information prefix operators ?? and ?.
 #
@@ -118,6 +151,19 @@ base_symbol_pattern_with_names_wildcard: Final[str] = (
 
 interior_symbol_pattern: Final[str] = rf"([0-9${symbol_first_letter}]+)"
 
+# Whitespace between tokens, and the delimiters that start or end a
+# (possibly nested) comment.
+BLANK_RE: Final[re.Pattern] = re.compile(r"[ \r\n\t]+")
+COMMENT_DELIMITER_RE: Final[re.Pattern] = re.compile(r"\(\*|\*\)")
+
+# A run of characters inside a String up to the next quote or backslash.
+STRING_SEGMENT_RE: Final[re.Pattern] = re.compile(r'[^"\\]+')
+
+# Used to extend a Symbol after an escaped letterlike character. This
+# is matched at a position, e.g. ``SYMBOL_EXTENSION_RE.match(text, pos)``,
+# so that the remaining input is not copied for each Symbol.
+SYMBOL_EXTENSION_RE: Final[re.Pattern] = re.compile(interior_symbol_pattern)
+
 # Symbol including context parts.
 FULL_SYMBOL_PATTERN_STR: Final[str] = (
     rf"(`?{base_symbol_pattern}(`{base_symbol_pattern})*)"
@@ -565,12 +611,25 @@ def init_module():
     TOKENS.clear()
     TOKEN_INDICES.clear()
     FILENAME_TOKENS.clear()
+    NAME_PATTERN_TOKENS.clear()
+    TOKEN_DISPATCH.clear()
+    FILENAME_DISPATCH.clear()
+    NAME_PATTERN_DISPATCH.clear()
+    GROUP_TAGS.clear()
 
     TOKENS.extend(compile_tokens(tokens))
     TOKEN_INDICES.update(find_indices(literal_tokens))
     FILENAME_TOKENS.extend(compile_tokens(filename_tokens))
     NAME_PATTERN_TOKENS.extend(compile_tokens(name_pattern_tokens))
 
+    TOKEN_DISPATCH.update(compile_dispatch(TOKENS, TOKEN_INDICES))
+    FILENAME_DISPATCH.update(compile_dispatch(FILENAME_TOKENS, {}))
+    NAME_PATTERN_DISPATCH.update(compile_dispatch(NAME_PATTERN_TOKENS, {}))
+
+    # A digit can only start a Number; see t_Number().
+    for c in string.digits:
+        TOKEN_DISPATCH[c] = PLAIN_NUMBER_RE
+
 
 def find_indices(literals: dict) -> Dict[str, Tuple[int, ...]]:
     "find indices of literal tokens"
@@ -609,6 +668,52 @@ def compile_tokens(token_list):
     return [(tag, compile_pattern(pattern)) for tag, pattern in token_list]
 
 
+# Maps the name of a group in a combined pattern, for a tag that has
+# more than one pattern, to that tag. See compile_alternation().
+GROUP_TAGS: Dict[str, str] = {}
+
+
+def compile_alternation(token_list) -> re.Pattern:
+    """Combine a list of (tag, compiled_pattern) tuples into a single
+    pattern. Each pattern becomes a group, and the alternatives are tried
+    in list order, so the first pattern in the list that matches wins,
+    just as it would when matching the patterns one at a time.
+
+    The group of the first pattern for a tag is named by the tag. A tag
+    can have several patterns, for example FormBox; the groups of the
+    later ones are named by the tag and their index in ``token_list``,
+    and ``GROUP_TAGS`` maps these names back to the tag. So after a
+    match, the tag is ``GROUP_TAGS.get(lastgroup, lastgroup)``.
+    """
+    alternatives = []
+    seen_tags = set()
+    for index, (tag, pattern) in enumerate(token_list):
+        group_name = tag
+        if tag in seen_tags:
+            group_name = f"{tag}__{index}"
+            GROUP_TAGS[group_name] = tag
+        seen_tags.add(tag)
+        # The newline ends any trailing verbose-mode comment in ``pattern``.
+        alternatives.append(f"(?P<{group_name}>{pattern.pattern}\n)")
+    return compile_pattern("|".join(alternatives))
+
+
+def compile_dispatch(token_list, token_indices: dict) -> Dict[str, re.Pattern]:
+    """Build a table mapping the leading character of a token to a single
+    combined pattern of the candidate tokens for that character, in
+    priority order.
+
+    The entry with key "" combines all of the tokens in ``token_list``;
+    it is used when the leading character has no entry of its own.
+    """
+    dispatch = {
+        char: compile_alternation([token_list[index] for index in indices])
+        for char, indices in token_indices.items()
+    }
+    dispatch[""] = compile_alternation(token_list)
+    return dispatch
+
+
 def is_symbol_name(text: str) -> bool:
     """
     Returns ``True`` if ``text`` is a valid identifier. Otherwise returns
@@ -632,20 +737,38 @@ class Token:
 
     The token's `pos` is the integer starting offset where
     `text` can be found inside the full input string.
+
+    Tokens are immutable and hashable, so they can be used as keys
+    in a dictionary or as members of a set. Tags are interned.
     """
 
+    __slots__ = ("_tag", "_text", "_pos")
+
     def __init__(self, tag: str, text: str, pos: int):
-        self.tag = tag
-        self.text = text
-        self.pos = pos
+        self._tag = intern(tag)
+        self._text = text
+        self._pos = pos
+
+    # Read-only access to the token's fields.
+    tag = property(attrgetter("_tag"))
+    text = property(attrgetter("_text"))
+    pos = property(attrgetter("_pos"))
 
     def __eq__(self, other):
         if not isinstance(other, Token):
-            raise TypeError()
+            return NotImplemented
         return (
-            self.tag == other.tag and self.text == other.text and self.pos == other.pos
+            self._tag is other._tag
+            and self._text == other._text
+            and self._pos == other._pos
         )
 
+    def __hash__(self) -> int:
+        return hash((self._tag, self._text, self._pos))
+
+    def __reduce__(self):
+        return (Token, (self._tag, self._text, self._pos))
+
     def __repr__(self) -> str:
         return f"Token({repr(self.tag)}, {repr(self.text)}, {self.pos})"
 
@@ -660,32 +783,154 @@ class Token:
         return f"LeafNode[{token_name}, {repr(self.text)}, {self.pos}]"
 
 
+def find_token_handlers(cls) -> Dict[str, Callable]:
+    """
+    Return a dictionary mapping a token tag to the custom tokenization
+    rule for that tag in class ``cls``. Custom tokenization rules are
+    the methods named t_<tag>.
+    """
+    return {
+        name[len("t_") :]: getattr(cls, name)
+        for name in dir(cls)
+        if name.startswith("t_")
+    }
+
+
+class SymbolTable:
+    """
+    Shared strings for the Symbol names found in scanning, so that each
+    distinct name is kept once, however many times it appears.
+
+    For each name, its context and short name are split out when the
+    name is first seen: ``split("System`Plot")`` is ``("System`",
+    "Plot")``, and the context of a name without one is "".
+
+    If ``max_names`` is given, the table is cleared when it is full, so
+    that its size stays bounded however many distinct names are seen.
+    """
+
+    def __init__(self, max_names: Optional[int] = None):
+        self.max_names = max_names
+        self.names: Dict[str, str] = {}
+        self.splits: Dict[str, Tuple[str, str]] = {}
+
+    def intern(self, name: str) -> str:
+        "Return the shared string for Symbol name ``name``"
+        shared_name = self.names.get(name)
+        if shared_name is None:
+            if self.max_names is not None and len(self.names) >= self.max_names:
+                self.clear()
+            shared_name = self.names[name] = name
+            context_end = name.rfind("`") + 1
+            self.splits[name] = (
+                self.intern(name[:context_end]) if context_end else "",
+                self.intern(name[context_end:]) if context_end else name,
+            )
+        return shared_name
+
+    def split(self, name: str) -> Tuple[str, str]:
+        "Return the context and the short name of Symbol name ``name``"
+        split = self.splits.get(name)
+        if split is None:
+            self.intern(name)
+            split = self.splits[name]
+        return split
+
+    def clear(self) -> None:
+        "Forget all of the names seen so far"
+        self.names.clear()
+        self.splits.clear()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class TokeniserState(NamedTuple):
+    """
+    The scanning state of a ``Tokeniser``, as saved by
+    ``Tokeniser.snapshot()``. The source text is shared, not copied.
+    """
+
+    local_pos: int
+    source_offset: int
+    source_text: str
+    mode: str
+    is_inside_box: bool
+
+
 class Tokeniser:
     """
     This converts input strings from a feeder and
     produces tokens of the Wolfram Language, which can then be used in parsing.
+
+    All of the input read so far is kept in ``source_buffer``, except by
+    a ``StreamingTokeniser``. Scanning is done on ``source_text``, which
+    is the part of that input from offset ``source_offset`` on; the text
+    before it has already been scanned. ``pos`` and token positions are
+    offsets into the whole input, while ``scan_pos`` is the scanning
+    position in ``source_text``. The two differ once input has been added
+    after the first line, so index ``source_text`` with ``scan_pos``, not
+    with ``pos``.
+
+    A ``t_<tag>`` rule is given a match made on ``source_text``. It moves
+    past its token with ``self.scan_pos = pattern_match.end(0)``, and the
+    position of the token is ``self.source_offset + pattern_match.start(0)``.
+
+    Tokens that have been looked at with ``peek()`` but not yet returned
+    by ``advance()`` or ``next()`` are kept in a ring buffer of
+    ``LOOKAHEAD_SIZE`` entries. Scanning has already gone past them, but
+    ``pos`` and ``snapshot()`` are for the position before them.
     """
 
+    # The largest number of tokens that can be looked ahead at.
+    LOOKAHEAD_SIZE = 4
+
+    # Maps a token tag to the (unbound) method for its custom
+    # tokenization rule. This is set below for this class and in
+    # __init_subclass__() for subclasses, so that subclasses can add
+    # t_<tag> rules.
+    token_handlers: Dict[str, Callable] = {}
+
     # TODO: Check if this dict should be updated using the init_module function
     modes = {
-        "expr": (TOKENS, TOKEN_INDICES),
-        "filename": (FILENAME_TOKENS, {}),
-        "name-pattern": (NAME_PATTERN_TOKENS, {}),
+        "expr": (TOKENS, TOKEN_INDICES, TOKEN_DISPATCH),
+        "filename": (FILENAME_TOKENS, {}, FILENAME_DISPATCH),
+        "name-pattern": (NAME_PATTERN_TOKENS, {}, NAME_PATTERN_DISPATCH),
     }
 
-    def __init__(self, feeder):
+    def __init__(self, feeder, symbol_table: Optional[SymbolTable] = None):
         """
         feeder: An instance of ``LineFeeder`` from which we receive
                 input strings that are to be split up and put into tokens.
+        symbol_table: The ``SymbolTable`` that Symbol names are shared
+                through. By default, each tokeniser has a table of its own;
+                pass the same table to share names between tokenisers.
         """
         assert len(TOKENS) > 0, (
             "Tokenizer was not initialized. "
             f"Check if {OPERATORS_TABLE_PATH} "
             "is available"
         )
-        self.pos: int = 0
+        self._pos: int = 0
+
+        # Tokens looked ahead at, together with the scanning state before
+        # each one. The first one is at index _lookahead_start.
+        self._lookahead: List[Optional[Tuple[Token, TokeniserState]]] = [
+            None
+        ] * self.LOOKAHEAD_SIZE
+        self._lookahead_start: int = 0
+        self._lookahead_count: int = 0
+
         self.feeder = feeder
+        self.symbol_table = SymbolTable() if symbol_table is None else symbol_table
+        # Where the input of this tokeniser starts in all of the text the
+        # feeder has fed, which can be read by several tokenisers.
+        self.feed_offset: int = (
+            0 if feeder.line_starts is None else feeder.line_starts.length
+        )
         self.source_text = self.feeder.feed()
+        self.source_offset: int = 0
+        self.source_buffer = SourceBuffer(self.source_text)
 
         self.mode: str = "invalid"
 
@@ -693,26 +938,133 @@ class Tokeniser:
         # This has an effect on which escape operators are allowed.
         self.is_inside_box: bool = False
 
+        # While getting the next line for a comment or a String that
+        # continues onto it: the depth of comment nesting, or the pieces
+        # of the String value so far. If get_more_input() is interrupted,
+        # as in a WaitingTokeniser, scanning can continue from these.
+        self._comment_depth: int = 0
+        self._string_segments: Optional[List[str]] = None
+
         self.change_token_scanning_mode("expr")
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.token_handlers = find_token_handlers(cls)
+
     def change_token_scanning_mode(self, mode: str):
         """
         Set the kinds of tokens that will be expected on the next token scan.
         See class variable "modes" above for the dictionary
         of token-scanning modes.
+
+        Tokens looked ahead at are kept if the first of them was scanned
+        in mode ``mode``; otherwise they are scanned again.
         """
+        if self._lookahead_count and self._first_lookahead_state().mode != mode:
+            self._drop_lookahead()
         self.mode = mode
-        self.tokens, self.token_indices = self.modes[mode]
+        self.tokens, self.token_indices, self.token_dispatch = self.modes[mode]
 
     def get_more_input(self):
         "Get another source-text line from input and continue."
 
+        if self._lookahead_count:
+            self._drop_lookahead()
         line: str = self.feeder.feed()
         if not line:
-            text = self.source_text[self.pos :].rstrip()
+            text = self.source_text[self._pos :].rstrip()
             self.feeder.message("Syntax", "sntxi", text)
             raise IncompleteSyntaxError("Syntax", "sntxi", text)
-        self.source_text += line
+        self._add_input(line)
+
+    def _add_input(self, line: str):
+        """Add ``line`` to the input. Text before the scanning position has
+        been scanned, so rather than copying all of the input read so far,
+        ``source_text`` now starts at the scanning position.
+        """
+        self.source_buffer.append(line)
+        consumed = min(self._pos, len(self.source_text))
+        self.source_text = self.source_text[consumed:] + line
+        self.source_offset += consumed
+        self._pos -= consumed
+
+    @property
+    def pos(self) -> int:
+        "The scanning position as an offset into the whole input"
+        if self._lookahead_count:
+            state = self._first_lookahead_state()
+            return state.source_offset + state.local_pos
+        return self.source_offset + self._pos
+
+    @pos.setter
+    def pos(self, value: int) -> None:
+        if self._lookahead_count:
+            self._drop_lookahead()
+        if value < self.source_offset:
+            # Go back to text before source_text, which is still in
+            # source_buffer unless a StreamingTokeniser has discarded it.
+            if value < self.source_buffer.start:
+                raise ValueError(
+                    f"cannot go back to position {value}: "
+                    "the input there has been discarded"
+                )
+            self.source_text = self.source_buffer.text(value)
+            self.source_offset = value
+        self._pos = value - self.source_offset
+        self._comment_depth = 0
+        self._string_segments = None
+
+    @property
+    def scan_pos(self) -> int:
+        "The scanning position as an offset into ``source_text``"
+        return self.pos - self.source_offset
+
+    @scan_pos.setter
+    def scan_pos(self, value: int) -> None:
+        self.pos = self.source_offset + value
+
+    def snapshot(self) -> TokeniserState:
+        """
+        Return the scanning state, so that scanning can later go back to
+        it with ``restore()``, for example after a speculative parse.
+        """
+        if self._lookahead_count:
+            return self._first_lookahead_state()
+        return TokeniserState(
+            self._pos,
+            self.source_offset,
+            self.source_text,
+            self.mode,
+            self._is_inside_box,
+        )
+
+    def restore(self, state: TokeniserState) -> None:
+        """
+        Go back to the scanning state ``state`` returned by ``snapshot()``.
+        Input read since then is kept, and will be scanned again.
+        """
+        source_text = state.source_text
+        source_end = state.source_offset + len(source_text)
+        if source_end < self.source_buffer.start:
+            position = state.source_offset + state.local_pos
+            raise ValueError(
+                f"cannot go back to position {position}: "
+                "input read after it has been discarded"
+            )
+        if self._lookahead_count:
+            self._lookahead_count = 0
+            self._lookahead[:] = [None] * self.LOOKAHEAD_SIZE
+        self._comment_depth = 0
+        self._string_segments = None
+        if source_end < len(self.source_buffer):
+            # Add the lines read after the snapshot was taken.
+            source_text += self.source_buffer.text(source_end)
+        self.source_text = source_text
+        self.source_offset = state.source_offset
+        self._pos = state.local_pos
+        self._is_inside_box = state.is_inside_box
+        if state.mode != self.mode:
+            self.change_token_scanning_mode(state.mode)
 
     @property
     def is_inside_box(self) -> bool:
@@ -724,8 +1076,96 @@ class Tokeniser:
 
     @is_inside_box.setter
     def is_inside_box(self, value: bool) -> None:
+        if (
+            self._lookahead_count
+            and self._first_lookahead_state().is_inside_box != value
+        ):
+            self._drop_lookahead()
         self._is_inside_box = value
 
+    def peek(self, k: int = 0) -> Token:
+        """
+        Return the token ``k`` tokens after the next one, without moving
+        past any tokens; ``peek()`` returns the token that ``advance()``
+        will return next. ``k`` must be less than ``LOOKAHEAD_SIZE``.
+        """
+        if not 0 <= k < self.LOOKAHEAD_SIZE:
+            raise ValueError(
+                f"can only look ahead up to {self.LOOKAHEAD_SIZE - 1} tokens, "
+                f"not {k}"
+            )
+        lookahead = self._lookahead
+        size = self.LOOKAHEAD_SIZE
+        count = self._lookahead_count
+        if count <= k:
+            # Scan up to the token asked for. While doing so, there is no
+            # lookahead as far as next() and the t_<tag> rules can tell.
+            self._lookahead_count = 0
+            try:
+                while count <= k:
+                    state = self.snapshot()
+                    lookahead[(self._lookahead_start + count) % size] = (
+                        self.next(),
+                        state,
+                    )
+                    count += 1
+            finally:
+                self._lookahead_count = count
+        return lookahead[(self._lookahead_start + k) % size][0]
+
+    def advance(self) -> Token:
+        "Return the next token, and move past it."
+        if not self._lookahead_count:
+            return self.next()
+        return self._pop_lookahead()
+
+    def _first_lookahead_state(self) -> TokeniserState:
+        "Return the scanning state before the first token looked ahead at"
+        return self._lookahead[self._lookahead_start][1]
+
+    def _pop_lookahead(self) -> Token:
+        "Remove the first token looked ahead at, and return it"
+        start = self._lookahead_start
+        token = self._lookahead[start][0]
+        self._lookahead[start] = None
+        self._lookahead_start = (start + 1) % self.LOOKAHEAD_SIZE
+        self._lookahead_count -= 1
+        return token
+
+    def _drop_lookahead(self) -> None:
+        "Go back to the scanning state before the tokens looked ahead at"
+        self.restore(self._first_lookahead_state())
+
+    def _line_starts(self) -> LineStarts:
+        "Return where the lines of the feeder start"
+        line_starts = self.feeder.line_starts
+        if line_starts is None:
+            raise ValueError(
+                "the feeder does not record where lines start: set "
+                "mathics_scanner.location.TRACK_LOCATIONS, or call the "
+                "feeder's track_line_starts() before scanning"
+            )
+        return line_starts
+
+    def position_to_line_col(self, pos: int) -> Tuple[int, int]:
+        """
+        Return the line number and column, both 0 origin, of position
+        ``pos`` in the input, such as the position of a token. The feeder
+        must record where lines start.
+        """
+        return self._line_starts().position_to_line_col(self.feed_offset + pos)
+
+    def source_range(self, start_pos: int, end_pos: int) -> SourceRange:
+        """
+        Return the ``SourceRange`` in the feeder's container from position
+        ``start_pos`` up to position ``end_pos`` in the input.
+        """
+        return self._line_starts().source_range(
+            self.feed_offset + start_pos,
+            self.feed_offset + end_pos,
+            self.feeder.container_index,
+        )
+
     def sntx_message(self, start_pos: Optional[int] = None) -> Tuple[str, int, int]:
         """Send a "sntx{b,f} error message to the input-reading
         feeder.
@@ -735,61 +1175,68 @@ class Tokeniser:
         """
         if start_pos is None:
             start_pos = self.pos
-        trailing_fragment = self.source_text[start_pos:].strip()
+        local_start_pos = start_pos - self.source_offset
+        if local_start_pos >= 0:
+            trailing_fragment = self.source_text[local_start_pos:].strip()
+        else:
+            trailing_fragment = self.source_buffer.text(start_pos).strip()
         end_pos = start_pos + len(trailing_fragment)
         if start_pos == 0:
             self.feeder.message("Syntax", "sntxb", trailing_fragment)
             tag = "sntxb"
         else:
+            if local_start_pos >= 0:
+                leading_fragment = (
+                    self.source_buffer.text(0, self.source_offset)
+                    + self.source_text[:local_start_pos]
+                )
+            else:
+                leading_fragment = self.source_buffer.text(0, start_pos)
             self.feeder.message(
                 "Syntax",
                 "sntxf",
-                self.source_text[:start_pos].strip(),
+                leading_fragment.strip(),
                 trailing_fragment,
             )
             tag = "syntx"
         return tag, start_pos, end_pos
 
-    # TODO: If this is converted this to __next__, then
-    # a tokeniser object is iterable.
+    # See also __iter__() which iterates over next() for all of the
+    # feeder's input.
     def next(self) -> Token:
         "Returns the next token from self.source_text."
+        if self._lookahead_count:
+            return self._pop_lookahead()
         self._skip_blank()
         source_text = self.source_text
 
-        if self.pos >= len(source_text):
-            return Token("END", "", len(source_text))
-
-        # Look for a matching pattern.
-        indices = self.token_indices.get(source_text[self.pos], ())
-        pattern_match: Optional[re.Match] = None
-        tag = "??invalid"
-        if indices:
-            for index in indices:
-                tag, pattern = self.tokens[index]
-                pattern_match = pattern.match(source_text, self.pos)
-                if pattern_match is not None:
-                    break
-        else:
-            for tag, pattern in self.tokens:
-                pattern_match = pattern.match(source_text, self.pos)
-                if pattern_match is not None:
-                    break
+        if self._pos >= len(source_text):
+            return Token("END", "", self.source_offset + len(source_text))
+
+        # Look for a matching pattern. A single combined pattern
+        # tries all of the candidates for the leading character.
+        pattern = self.token_dispatch.get(source_text[self._pos])
+        if pattern is None:
+            pattern = self.token_dispatch[""]
+        pattern_match: Optional[re.Match] = pattern.match(source_text, self._pos)
 
         # No matching pattern found.
         if pattern_match is None:
             tag, pre_str, post_str = self.sntx_message()
             raise SyntaxError(tag, pre_str, post_str)
 
+        tag = pattern_match.lastgroup
+        tag = GROUP_TAGS.get(tag, tag)
+
         # Look for custom tokenization rules; those are defined with t_tag.
-        override = getattr(self, "t_" + tag, None)
-        if override is not None:
-            return override(pattern_match)
+        handler = self.token_handlers.get(tag)
+        if handler is not None:
+            return handler(self, pattern_match)
 
         # Failing a custom tokenization rule, we use the regular expression
         # pattern match.
         text = pattern_match.group(0)
-        self.pos = pattern_match.end(0)
+        self._pos = pattern_match.end(0)
 
         # The below is similar to what we do in t_RawBackslash, but it is
         # different.  First, we need to look for a closing quote
@@ -806,7 +1253,7 @@ class Tokeniser:
             # abc\[Mu] is a valid 4-character Symbol. And we can have things like
             # abc\[Mu]\[Mu]def\[Mu]1
             while True:
-                if self.pos >= len(source_text):
+                if self._pos >= len(source_text):
                     break
 
                 # Try to extend symbol with non-escaped alphanumeric
@@ -814,20 +1261,17 @@ class Tokeniser:
 
                 # TODO: Do we need to add context breaks? And if so,
                 # do we need to check for consecutive ``'s?
-                alphanumeric_match = re.match(
-                    f"[0-9${symbol_first_letter}]+", self.source_text[self.pos :]
-                )
+                alphanumeric_match = SYMBOL_EXTENSION_RE.match(source_text, self._pos)
                 if alphanumeric_match is not None:
-                    extension_str = alphanumeric_match.group(0)
-                    text += extension_str
-                    self.pos += len(extension_str)
+                    text += alphanumeric_match.group(0)
+                    self._pos = alphanumeric_match.end(0)
 
-                if source_text[self.pos] != "\\":
+                if not source_text.startswith("\\", self._pos):
                     break
 
                 try:
                     escape_str, next_pos = parse_escape_sequence(
-                        self.source_text, self.pos + 1, is_in_string=False
+                        self.source_text, self._pos + 1, is_in_string=False
                     )
                 except (EscapeSyntaxError, NamedCharacterSyntaxError) as escape_error:
                     if self.is_inside_box:
@@ -840,46 +1284,109 @@ class Tokeniser:
                     raise
                 if escape_str in LETTERLIKES:
                     text += escape_str
-                    self.pos = next_pos
+                    self._pos = next_pos
                 else:
                     break
 
-        return Token(tag, text, pattern_match.start(0))
+            text = self.symbol_table.intern(text)
+
+        return Token(tag, text, self.source_offset + pattern_match.start(0))
+
+    def __iter__(self) -> Iterator[Token]:
+        """Yield the tokens of everything the feeder has to give, not
+        including the final "END" token.
+
+        Lines are pulled from the feeder lazily, only when the input so far
+        has been used up; token positions are offsets from the start of the
+        first line.
+        """
+        next_token = self.next
+        feed = self.feeder.feed
+        while True:
+            token = next_token()
+            if token.tag == "END":
+                line = feed()
+                if not line:
+                    return
+                self._add_input(line)
+                continue
+            yield token
+
+    def spans(self) -> Iterator[Tuple[Token, int, int]]:
+        """Like iterating over the tokeniser, but yield each token together
+        with the offsets of the start of its source text and just after it.
+
+        Unlike the position of the token, these are the offsets of its
+        source text even when the token is a String, or its text has had
+        escape sequences replaced.
+        """
+        if self._lookahead_count:
+            self._drop_lookahead()
+        next_token = self.next
+        skip_blank = self._skip_blank
+        feed = self.feeder.feed
+        while True:
+            # Tokens start where scanning starts after blanks and comments.
+            skip_blank()
+            start = self.source_offset + self._pos
+            token = next_token()
+            if token.tag == "END":
+                line = feed()
+                if not line:
+                    return
+                self._add_input(line)
+                continue
+            yield token, start, self.source_offset + self._pos
+
+    def tokenize_all(self) -> List[Token]:
+        """Scan everything the feeder has to give, and return the list of
+        tokens found, not including the final "END" token.
+        """
+        return list(self)
 
     def _skip_blank(self):
         "Skip whitespace and comments"
-        comment = []  # start positions of comments
+        source_text = self.source_text
+        pos = self._pos
         while True:
-            if self.pos >= len(self.source_text):
-                if comment:
-                    self.get_more_input()
-                else:
-                    break
-            if comment:
-                if self.source_text.startswith("(*", self.pos):
-                    comment.append(self.pos)
-                    self.pos += 2
-                elif self.source_text.startswith("*)", self.pos):
-                    comment.pop()
-                    self.pos += 2
-                else:
-                    self.pos += 1
-            elif self.source_text.startswith("(*", self.pos):
-                comment.append(self.pos)
-                self.pos += 2
-            elif self.source_text[self.pos] in " \r\n\t":
-                self.pos += 1
-            elif (
-                self.source_text[self.pos] == "\\"
-                and self.pos + 2 == len(self.source_text)
-                and self.source_text[self.pos + 1] == "\n"
-            ):
+            blank_match = BLANK_RE.match(source_text, pos)
+            if blank_match is not None:
+                pos = blank_match.end(0)
+            if source_text.startswith("(*", pos):
+                self._pos = pos + 2
+                self._skip_comment()
+                source_text = self.source_text
+                pos = self._pos
+            elif source_text.startswith("\\\n", pos) and pos + 2 == len(source_text):
                 # We have a backslashed \n probably in order to split
                 # a long Mathics3 source-text line.  Treat this as
                 # whitespace.
-                self.pos += 2
+                pos += 2
             else:
                 break
+        self._pos = pos
+
+    def _skip_comment(self, depth: int = 1):
+        """Skip to the end of a comment whose opening "(*" has been
+        scanned, ``depth`` levels deep. Comments can be nested and can span
+        several lines.
+        """
+        while True:
+            delimiter_match = COMMENT_DELIMITER_RE.search(self.source_text, self._pos)
+            if delimiter_match is None:
+                # The comment continues on the next line.
+                self._pos = len(self.source_text)
+                self._comment_depth = depth
+                self.get_more_input()
+                self._comment_depth = 0
+                continue
+            self._pos = delimiter_match.end(0)
+            if delimiter_match.group(0) == "(*":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
 
     def _token_mode(self, pattern_match: re.Match, tag: str, mode: str) -> Token:
         """
@@ -889,9 +1396,9 @@ class Tokeniser:
         Also switch token-scanning mode.
         """
         text = pattern_match.group(0)
-        self.pos = pattern_match.end(0)
+        self._pos = pattern_match.end(0)
         self.change_token_scanning_mode(mode)
-        return Token(tag, text, pattern_match.start(0))
+        return Token(tag, text, self.source_offset + pattern_match.start(0))
 
     def t_Filename(self, pattern_match: re.Match) -> Token:
         """
@@ -905,15 +1412,22 @@ class Tokeniser:
 
     def t_Number(self, pattern_match: re.Match) -> Token:
         "Break out from ``pattern_match`` the next token which is expected to be a Number"
-        text = pattern_match.group(0)
+        source_text = self.source_text
         pos = pattern_match.end(0)
-        if self.source_text[pos - 1 : pos + 1] == "..":
+        if (
+            source_text.startswith(NUMBER_CONTINUATIONS, pos)
+            and pattern_match.re is PLAIN_NUMBER_RE
+        ):
+            pattern_match = NUMBER_RE.match(source_text, pattern_match.start(0))
+            pos = pattern_match.end(0)
+        text = pattern_match.group(0)
+        if source_text[pos - 1 : pos + 1] == "..":
             # Trailing .. should be ignored. That is, `1..` is `Repeated[1]`.
             text = text[:-1]
-            self.pos = pos - 1
+            self._pos = pos - 1
         else:
-            self.pos = pos
-        return Token("Number", text, pattern_match.start(0))
+            self._pos = pos
+        return Token("Number", text, self.source_offset + pattern_match.start(0))
 
     def t_Put(self, pattern_match: re.Match) -> Token:
         "Scan for a ``Put`` token and return that"
@@ -938,22 +1452,23 @@ class Tokeniser:
 
     def t_RawBackslash(self, pattern_match: Optional[re.Match]) -> Token:
         r"""Break out from ``pattern_match`` tokens which start with a backslash, '\'."""
-        source_text = self.source_text
-        start_pos = self.pos + 1
+        start_pos = self._pos + 1
         named_character = ""
-        if start_pos == len(source_text):
+        if start_pos == len(self.source_text):
             # We have reached the end of the input line before seeing a termination
             # of backslash. Fetch another line.
             self.get_more_input()
-            self.pos += 1
-            source_text += self.source_text
+            start_pos = self._pos + 1
+        source_text = self.source_text
+        # The position of the backslash in the whole input.
+        token_pos = self.source_offset + start_pos - 1
 
         try:
-            escape_str, self.pos = parse_escape_sequence(
+            escape_str, self._pos = parse_escape_sequence(
                 source_text, start_pos, is_in_string=False
             )
-            if source_text[start_pos] == "[" and source_text[self.pos - 1] == "]":
-                named_character = source_text[start_pos + 1 : self.pos - 1]
+            if source_text[start_pos] == "[" and source_text[self._pos - 1] == "]":
+                named_character = source_text[start_pos + 1 : self._pos - 1]
         except (EscapeSyntaxError, NamedCharacterSyntaxError) as escape_error:
             self.feeder.message(escape_error.name, escape_error.tag, *escape_error.args)
             raise
@@ -961,32 +1476,24 @@ class Tokeniser:
         # Is there a way to DRY with "next()?
         if named_character != "":
             if named_character in NO_MEANING_OPERATORS:
-                return Token(named_character, escape_str, start_pos - 1)
+                return Token(named_character, escape_str, token_pos)
 
         # Look for a pattern matching leading context \.
 
-        indices = self.token_indices.get(escape_str[0], ())
-        pattern_match = None
-        tag = "??invalid"
-        if indices:
-            for index in indices:
-                tag, pattern = self.tokens[index]
-                pattern_match = pattern.match(escape_str, 0)
-                if pattern_match is not None:
-                    break
-        else:
-            for tag, pattern in self.tokens:
-                pattern_match = pattern.match(escape_str, 0)
-                if pattern_match is not None:
-                    break
+        pattern = self.token_dispatch.get(escape_str[0])
+        if pattern is None:
+            pattern = self.token_dispatch[""]
+        pattern_match = pattern.match(escape_str, 0)
 
         # No matching found.
         if pattern_match is None:
             tag, pre, post = self.sntx_message()
             raise SyntaxError(tag, pre, post)
 
+        tag = pattern_match.lastgroup
+        tag = GROUP_TAGS.get(tag, tag)
+
         text = pattern_match.group(0)
-        start_pos = pattern_match.start(0)
 
         # Is there a way to DRY with t_String?"
         # See t_String for differences.
@@ -998,7 +1505,7 @@ class Tokeniser:
             # is a valid Symbol. But we can also have symbols for
             # \[Mu]\[Theta], \[Mu]1, \[Mu]1a, \[Mu]\.42, \[Mu]\061, or \[Mu]\061abc
             while True:
-                if self.pos >= len(source_text):
+                if self._pos >= len(source_text):
                     break
 
                 # Try to extend symbol with non-escaped alphanumeric
@@ -1006,20 +1513,17 @@ class Tokeniser:
 
                 # TODO: Do we need to add context breaks? And if so,
                 # do we need to check for consecutive ``'s?
-                alphanumeric_match = re.match(
-                    f"[0-9${symbol_first_letter}]+", source_text[self.pos :]
-                )
+                alphanumeric_match = SYMBOL_EXTENSION_RE.match(source_text, self._pos)
                 if alphanumeric_match is not None:
-                    extension_str = alphanumeric_match.group(0)
-                    text += extension_str
-                    self.pos += len(extension_str)
+                    text += alphanumeric_match.group(0)
+                    self._pos = alphanumeric_match.end(0)
 
-                if source_text[self.pos] != "\\":
+                if not source_text.startswith("\\", self._pos):
                     break
 
                 try:
                     escape_str, next_pos = parse_escape_sequence(
-                        self.source_text, self.pos + 1, is_in_string=False
+                        self.source_text, self._pos + 1, is_in_string=False
                     )
                 except (EscapeSyntaxError, NamedCharacterSyntaxError) as escape_error:
                     if self.is_inside_box:
@@ -1030,28 +1534,35 @@ class Tokeniser:
                         escape_error.name, escape_error.tag, escape_error.args
                     )
                     raise
-                if re.match(interior_symbol_pattern, escape_str):
+                if SYMBOL_EXTENSION_RE.match(escape_str):
                     text += escape_str
-                    self.pos = next_pos
+                    self._pos = next_pos
                 else:
                     break
 
+            text = self.symbol_table.intern(text)
+
         elif tag == "String":
             self.feeder.message("Syntax", "sntxi", text)
             raise InvalidSyntaxError("Syntax", "sntxi", text)
 
-        return Token(tag, text, start_pos)
+        return Token(tag, text, token_pos)
 
     def t_String(self, _: Optional[re.Match]) -> Token:
         """Break out from self.source_text the next token which is expected to be a String.
         The string value of the returned token will have a double quote (") in the first and last
         positions of the returned string.
         """
-        end = None
-        self.pos += 1  # skip opening '"'
-        newlines = []
+        self._pos += 1  # skip opening '"'
+        return self._scan_string([])
+
+    def _scan_string(self, segments: List[str]) -> Token:
+        """Scan the rest of a String, from the scanning position on.
+        ``segments`` are the pieces of the String value before there, and
+        the pieces after are added to it; they are joined at the end.
+        """
         source_text = self.source_text
-        result = ""
+        append = segments.append
 
         # The below is similar to what we do in t_RawBackslash, but it is
         # different.  First, we need to look for a closing quote
@@ -1061,71 +1572,142 @@ class Tokeniser:
         # in a Symbol name or as a boxing construct
 
         while True:
-            if self.pos >= len(source_text):
-                if end is None:
-                    # reached end while still inside string
-                    self.get_more_input()
-                    newlines.append(self.pos)
-                    source_text = self.source_text
-                else:
-                    break
-            char = source_text[self.pos]
-            if char == '"':
-                self.pos += 1
-                end = self.pos
+            # Take everything up to the next quote or backslash in one step.
+            segment_match = STRING_SEGMENT_RE.match(source_text, self._pos)
+            if segment_match is not None:
+                append(segment_match.group(0))
+                self._pos = segment_match.end(0)
+
+            if self._pos >= len(source_text):
+                # reached end while still inside string
+                self._string_segments = segments
+                self.get_more_input()
+                self._string_segments = None
+                source_text = self.source_text
+                continue
+
+            if source_text[self._pos] == '"':
+                self._pos += 1
                 break
 
-            if char == "\\":
-                if self.pos + 1 == len(source_text):
-                    # We have reached the end of the input line before seeing a terminating
-                    # quote ("). Fetch another line.
-                    self.get_more_input()
-                self.pos += 1
-                try:
-                    escape_str, self.pos = parse_escape_sequence(
-                        source_text, self.pos, is_in_string=True
-                    )
-                except NamedCharacterSyntaxError as escape_error:
+            # We have a backslash.
+            if self._pos + 1 == len(source_text):
+                # We have reached the end of the input line before seeing a terminating
+                # quote ("). Fetch another line.
+                self._string_segments = segments
+                self.get_more_input()
+                self._string_segments = None
+                source_text = self.source_text
+            self._pos += 1
+
+            escaped_char = source_text[self._pos]
+            escape_str = SINGLE_CHARACTER_ESCAPES.get(escaped_char)
+            if escape_str is not None:
+                append(escape_str)
+                self._pos += 1
+                continue
+
+            try:
+                escape_str, self._pos = parse_escape_sequence(
+                    source_text, self._pos, is_in_string=True
+                )
+            except NamedCharacterSyntaxError as escape_error:
+                self.feeder.message(
+                    escape_error.name, escape_error.tag, *escape_error.args
+                )
+                raise
+
+            # This has to come after NamedCharacterSyntaxError since
+            # that is a subclass of this.
+            except EscapeSyntaxError as escape_error:
+                # If there is boxing construct matched, we preserve
+                # what was given, but do not tokenize the
+                # construct. "\(" remains "\(" and is not turned into
+                # InterpretBox".  Some characters like "{", and "}"
+                # are also allowed to follow a "\" in the String
+                # context, but any other character is an error.
+                if escaped_char in BOXING_CONSTRUCT_SUFFIXES or escaped_char in "{}":
+                    append("\\" + escaped_char)
+                    self._pos += 1
+                else:
                     self.feeder.message(
                         escape_error.name, escape_error.tag, *escape_error.args
                     )
                     raise
-
-                # This has to come after NamedCharacterSyntaxError since
-                # that is a subclass of this.
-                except EscapeSyntaxError as escape_error:
-                    escaped_char = self.source_text[self.pos]
-                    if escaped_char in BOXING_CONSTRUCT_SUFFIXES:
-                        # If there is boxing construct matched, we
-                        # preserve what was given, but do not tokenize
-                        # the construct. "\(" remains "\(" and is not
-                        # turned into InterpretBox".
-                        result += "\\" + escaped_char
-                        self.pos += 1
-                    else:
-                        # Not something that can be a boxing
-                        # construct.  Some characters like "{", and
-                        # "}" are allowed to follow a "\" in the
-                        # String context, but any other character is
-                        # an error.
-                        if self.source_text[self.pos] in ["{", "}"]:
-                            result += "\\" + escaped_char
-                            self.pos += 1
-                        else:
-                            self.feeder.message(
-                                escape_error.name, escape_error.tag, *escape_error.args
-                            )
-                            raise
-                else:
-                    result += escape_str
             else:
-                result += self.source_text[self.pos]
-                self.pos += 1
+                append(escape_str)
 
         # FIXME: rethink whether we really need quotes at the beginning and
         # and of a string and redo. This will include revising whatever calls
         # parser.unescape string().
-        return Token("String", f'"{result}"', self.pos)
+        return Token("String", f'"{"".join(segments)}"', self.pos)
+
+
+Tokeniser.token_handlers = find_token_handlers(Tokeniser)
+
+
+class StreamingTokeniser(Tokeniser):
+    """
+    A ``Tokeniser`` for inputs too large to keep in memory, such as
+    generated data files of several gigabytes.
+
+    As lines are read, the lines before the token being scanned are
+    discarded from ``source_buffer``, unless they are still needed to go
+    back to the start of a token that has been looked ahead at with
+    ``peek()``. So memory use depends on the length of the longest token,
+    comment or line, rather than on the length of the input. Token
+    positions are still offsets into the whole input. For the same
+    reason, the feeder is set to keep none of the text it feeds, with
+    ``SourceRetention.NONE``.
+
+    Going back with ``restore()`` to a state before the discarded input
+    raises ValueError, and "sntxf" messages only show the text that is
+    still kept. Where the discarded lines start is dropped from the
+    feeder's ``line_starts`` too, so ``position_to_line_col()`` only
+    works for positions in the input still kept.
+
+    Unless another is given, the symbol table is cleared when it has
+    ``MAX_SYMBOL_NAMES`` names.
+    """
+
+    MAX_SYMBOL_NAMES = 1 << 16
+
+    def __init__(self, feeder, symbol_table: Optional[SymbolTable] = None):
+        if symbol_table is None:
+            symbol_table = SymbolTable(self.MAX_SYMBOL_NAMES)
+        # Otherwise, a feeder such as a FileLineFeeder keeps all of the
+        # input in its own source_text.
+        feeder.retention = SourceRetention.NONE
+        super().__init__(feeder, symbol_table)
+        # The end of the input read when the token being scanned was
+        # started. Going back to that start needs the input after it.
+        self._token_input_end: int = len(self.source_buffer)
+
+    def next(self) -> Token:
+        if not self._lookahead_count:
+            self._token_input_end = self.source_offset + len(self.source_text)
+        return super().next()
+
+    def _add_input(self, line: str):
+        super()._add_input(line)
+        keep_from = min(self.source_offset, self._token_input_end)
+        first_lookahead = self._lookahead[self._lookahead_start]
+        if first_lookahead is not None:
+            # Tokens are being, or have been, looked ahead at.
+            state = first_lookahead[1]
+            keep_from = min(keep_from, state.source_offset + len(state.source_text))
+        self.source_buffer.discard(keep_from)
+        if self.feeder.line_starts is not None:
+            self.feeder.line_starts.discard(self.feed_offset + keep_from)
+
+
+def tokenize(source_text: str, container: str = "<string>") -> List[Token]:
+    """Return the list of tokens in ``source_text``, not including the
+    final "END" token.
+    """
+    return Tokeniser(
+        SingleLineFeeder(source_text, container, ContainerKind.STRING)
+    ).tokenize_all()
 
 
 # Call the function that initializes the dictionaries.
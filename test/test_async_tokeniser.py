@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for tokenizing input that arrives asynchronously.
+"""
+
+import asyncio
+
+import pytest
+
+from mathics_scanner import tokeniser as tokeniser_module
+from mathics_scanner.async_tokeniser import AsyncTokeniser
+from mathics_scanner.errors import IncompleteSyntaxError
+from mathics_scanner.feed import AsyncLineFeeder
+from mathics_scanner.tokeniser import Token, tokenize
+
+
+class QueueLineFeeder(AsyncLineFeeder):
+    "Feeds lines put in an asyncio queue; None ends the input."
+
+    def __init__(self):
+        super().__init__("<queue>")
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def read_line(self) -> str:
+        line = await self.queue.get()
+        return "" if line is None else line
+
+
+async def tokens_as_lines_arrive(lines):
+    """Put ``lines`` one at a time, and return the tokens seen after
+    each line"""
+    feeder = QueueLineFeeder()
+    tokens = []
+    seen = []
+
+    async def read_tokens():
+        async for token in AsyncTokeniser(feeder):
+            tokens.append(token)
+
+    reader = asyncio.ensure_future(read_tokens())
+    for line in lines + [None]:
+        await feeder.queue.put(line)
+        # Let the reader scan what it can.
+        for _ in range(10):
+            await asyncio.sleep(0)
+        seen.append(list(tokens))
+    await reader
+    return tokens, seen, feeder
+
+
+def test_async_tokens():
+    lines = ["f[x_] := x + 1\n", 'g["a\n', 'b"] (* c\n', "d *) + h\n"]
+    tokens, seen, _ = asyncio.run(tokens_as_lines_arrive(lines))
+    assert tokens == tokenize("".join(lines))
+
+    # Tokens are seen as soon as the line they end in has arrived.
+    assert seen[0][-1] == Token("Number", "1", 13)
+    assert seen[1][-1] == Token("RawLeftBracket", "[", 16)
+    assert seen[2][-1] == Token("RawRightBracket", "]", 22)
+    assert seen[3][-1] == Token("Symbol", "h", 36)
+
+
+class CountingPattern:
+    "Counts the characters searched with a compiled pattern"
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.characters = 0
+
+    def search(self, text, pos):
+        self.characters += len(text) - pos
+        return self.pattern.search(text, pos)
+
+    def match(self, text, pos):
+        self.characters += len(text) - pos
+        return self.pattern.match(text, pos)
+
+
+def test_async_long_tokens(monkeypatch):
+    comment = CountingPattern(tokeniser_module.COMMENT_DELIMITER_RE)
+    string = CountingPattern(tokeniser_module.STRING_SEGMENT_RE)
+    monkeypatch.setattr(tokeniser_module, "COMMENT_DELIMITER_RE", comment)
+    monkeypatch.setattr(tokeniser_module, "STRING_SEGMENT_RE", string)
+
+    count = 200
+    lines = ["(* a\n"] + ["b\n"] * count + ['*) x "a\n'] + ["b\n"] * count
+    lines.append('" y\n')
+    tokens, seen, _ = asyncio.run(tokens_as_lines_arrive(lines))
+    assert [token.tag for token in tokens] == ["Symbol", "String", "Symbol"]
+    assert seen[count + 1] == tokens[:1]
+
+    # Scanning continues where it stopped as each line arrives, rather
+    # than going back to the start of the comment or String.
+    length = len("".join(lines))
+    assert comment.characters <= 2 * length
+    assert string.characters <= 2 * length
+
+
+def test_async_incomplete():
+    with pytest.raises(IncompleteSyntaxError):
+        asyncio.run(tokens_as_lines_arrive(['"a\n', "b\n"]))
+
+
+def test_async_empty():
+    tokens, _, feeder = asyncio.run(tokens_as_lines_arrive([]))
+    assert tokens == []
+    assert feeder.empty()
@@ -14,14 +14,7 @@ def tokens(source_text: str) -> List[Token]:
     tokeniser = Tokeniser(
         SingleLineFeeder(source_text, "<tokens>", ContainerKind.STRING)
     )
-    tokens = []
-    while True:
-        token = tokeniser.next()
-        if token.tag == "END":
-            break
-        else:
-            tokens.append(token)
-    return [token.code_tokenize_format for token in tokens]
+    return [token.code_tokenize_format for token in tokeniser.tokenize_all()]
 
 
 def test_CodeTokenize():
@@ -1,9 +1,21 @@
 # -*- coding: utf-8 -*-
 
+import os
 import tempfile
 
-from mathics_scanner.feed import FileLineFeeder, MultiLineFeeder, SingleLineFeeder
-from mathics_scanner.location import ContainerKind
+import pytest
+
+from mathics_scanner import feed, location
+from mathics_scanner.feed import (
+    EncodingDetectingFileLineFeeder,
+    FileLineFeeder,
+    MappedFileLineFeeder,
+    MultiLineFeeder,
+    SingleLineFeeder,
+    SourceRetention,
+    detect_encoding,
+)
+from mathics_scanner.location import ContainerKind, LineStarts
 
 
 def test_multi():
@@ -33,3 +45,257 @@ def test_file():
         assert feeder.feed() == "def\n", "FileLineFeeder reads second line"
         assert feeder.feed() == "", "FileLineFeeder detects feeder empty condition"
         assert feeder.empty()
+        assert feeder.source_text == "abc\ndef\n"
+
+
+def test_mapped_file():
+    """MappedFileLineFeeder feeds the same lines as FileLineFeeder"""
+    for source_text in ("", "abc", "a\n\n\nb\r\nc\rd\n\n", "\n\nx = 1\n\ny\n"):
+        with tempfile.NamedTemporaryFile("w+b") as f:
+            f.write(source_text.encode("utf-8"))
+            f.flush()
+            f.seek(0)
+            mapped_trace, trace = [], []
+            mapped_feeder = MappedFileLineFeeder(
+                f, trace_fn=lambda *args: mapped_trace.append(args)
+            )
+            with open(f.name, "r", encoding="utf-8") as text_file:
+                feeder = FileLineFeeder(
+                    text_file, trace_fn=lambda *args: trace.append(args)
+                )
+                while True:
+                    line = feeder.feed()
+                    assert mapped_feeder.feed() == line
+                    assert mapped_feeder.lineno == feeder.lineno
+                    if not line:
+                        break
+            assert mapped_feeder.empty()
+            assert mapped_feeder.source_text == feeder.source_text
+            assert mapped_feeder.container == f.name
+            assert mapped_trace == trace
+
+
+def test_retention():
+    """Feeders keep as much of the text fed as their retention says"""
+    source_text = "a = 1;\nb = {\n2};\nc\n"
+    with tempfile.NamedTemporaryFile("w+") as f:
+        f.write(source_text)
+        f.flush()
+        for retention, kept_texts in (
+            (
+                SourceRetention.FULL,
+                ["a = 1;\n", "a = 1;\nb = {\n2};\n", source_text],
+            ),
+            # The text from the line the statement starts on, or just before.
+            (
+                SourceRetention.STATEMENT,
+                ["a = 1;\n", "a = 1;\nb = {\n2};\n", "2};\nc\n"],
+            ),
+            (SourceRetention.NONE, ["", "", ""]),
+        ):
+            f.seek(0)
+            binary_file = open(f.name, "rb")
+            for feeder in (
+                FileLineFeeder(f, retention=retention),
+                MultiLineFeeder(
+                    source_text, "<test_retention>", ContainerKind.STRING, retention
+                ),
+                MappedFileLineFeeder(binary_file, retention=retention),
+            ):
+                feeder.start_statement()
+                assert feeder.feed() == "a = 1;\n"
+                assert feeder.source_text == kept_texts[0]
+                feeder.start_statement()
+                feeder.feed()
+                feeder.feed()
+                assert feeder.source_text == kept_texts[1]
+                feeder.start_statement()
+                assert feeder.feed() == "c\n"
+                assert feeder.source_text == kept_texts[2]
+                assert feeder.feed() == ""
+                assert feeder.source_text == kept_texts[2]
+            binary_file.close()
+
+    # Blank lines before a statement are not kept with it.
+    with tempfile.NamedTemporaryFile("w+") as f:
+        f.write("a\n\n\nb\n")
+        f.flush()
+        f.seek(0)
+        with open(f.name, "rb") as binary_file:
+            for feeder in (
+                FileLineFeeder(f, retention=SourceRetention.STATEMENT),
+                MappedFileLineFeeder(binary_file, retention=SourceRetention.STATEMENT),
+            ):
+                feeder.feed()
+                feeder.feed()
+                feeder.start_statement()
+                assert feeder.source_text == "b\n"
+
+    # The text kept can only be changed by feeding lines.
+    feeder = MultiLineFeeder("a\n", "<test_retention>", ContainerKind.STRING)
+    with pytest.raises(AttributeError):
+        feeder.source_text = "b\n"
+    assert feeder.feed() == "a\n"
+
+
+def test_detect_encoding():
+    """Encodings are found from byte-order marks, or UTF-8 is checked for"""
+    text = "f[\u03b1] = \u00e9"
+    assert detect_encoding(text.encode("utf-8-sig")) == "utf-8-sig"
+    assert detect_encoding(text.encode("utf-16")) == "utf-16"
+    assert detect_encoding(text.encode("utf-32")) == "utf-32"
+    assert detect_encoding(text.encode("utf-8")) == "utf-8"
+    # The start of a file can end part way through a character.
+    assert detect_encoding(text.encode("utf-8")[:-1]) == "utf-8"
+    assert detect_encoding(b"") == "utf-8"
+
+
+def test_encoding_detecting_file(monkeypatch):
+    """EncodingDetectingFileLineFeeder decodes files in the encoding detected"""
+    source_text = 'a = "\u00e9\u03b1"\r\n\nb\n'
+    for encoding in ("utf-8", "utf-8-sig", "utf-16", "utf-32"):
+        with tempfile.NamedTemporaryFile("w+b") as f:
+            f.write(source_text.encode(encoding))
+            f.flush()
+            f.seek(0)
+            feeder = EncodingDetectingFileLineFeeder(f)
+            assert feeder.encoding == encoding
+            assert feeder.container == f.name
+            assert feeder.feed() == 'a = "\u00e9\u03b1"\n'
+            assert feeder.feed() == "b\n"
+            assert feeder.lineno == 3
+            assert feeder.feed() == ""
+            assert feeder.empty()
+            assert not f.closed
+
+    with tempfile.NamedTemporaryFile("w+b") as f:
+        f.write(source_text.encode("utf-16"))
+        f.flush()
+        f.seek(0)
+        EncodingDetectingFileLineFeeder(f)
+
+        # The encoding is remembered until the file changes.
+        def no_detection(head):
+            raise AssertionError("the encoding should not be detected again")
+
+        monkeypatch.setattr(feed, "detect_encoding", no_detection)
+        f.seek(0)
+        feeder = EncodingDetectingFileLineFeeder(f)
+        assert feeder.encoding == "utf-16"
+        assert feeder.feed() == 'a = "\u00e9\u03b1"\n'
+
+        monkeypatch.undo()
+        f.seek(0)
+        f.write(b"x\n")
+        f.truncate()
+        f.flush()
+        os.utime(f.name, ns=(0, 0))
+        f.seek(0)
+        feeder = EncodingDetectingFileLineFeeder(f)
+        assert feeder.encoding == "utf-8"
+        assert feeder.feed() == "x\n"
+
+
+def test_encoding_detecting_chardet():
+    """Files in other encodings are decoded in the encoding chardet guesses"""
+    pytest.importorskip("chardet")
+    source_text = (
+        "(* Beispiel f\u00fcr eine Gr\u00f6\u00dfenberechnung: \u00c4, \u00d6 und "
+        "\u00dc werden gepr\u00fcft. *)\n"
+        "f[gr\u00f6\u00dfe_] := gr\u00f6\u00dfe * 2; (* Sch\u00e4tzung der "
+        "L\u00e4nge, sp\u00e4ter verbessern *)\n"
+        'caf\u00e9 = "D\u00e9j\u00e0 vu \u00e0 la fran\u00e7aise, tr\u00e8s '
+        '\u00e9l\u00e9gant";\n'
+    )
+    with tempfile.NamedTemporaryFile("w+b") as f:
+        f.write(source_text.encode("latin-1"))
+        f.flush()
+        f.seek(0)
+        feeder = EncodingDetectingFileLineFeeder(f)
+        assert "".join(iter(feeder.feed, "")) == source_text
+
+
+def test_line_starts():
+    """Feeders find the line and column of positions in the text fed"""
+    source_text = "a\nbc\n\nd\n"
+    feeders = [
+        SingleLineFeeder(source_text, "<test_line_starts>", ContainerKind.STRING),
+        MultiLineFeeder(source_text, "<test_line_starts>", ContainerKind.STRING),
+    ]
+    for feeder in feeders:
+        feeder.track_line_starts()
+        while feeder.feed():
+            pass
+        line_starts = feeder.line_starts
+        assert [line_starts.position_to_line_col(pos) for pos in range(9)] == [
+            (0, 0),
+            (0, 1),
+            (1, 0),
+            (1, 1),
+            (1, 2),
+            (2, 0),
+            (3, 0),
+            (3, 1),
+            (3, 2),
+        ]
+        assert line_starts.source_range(3, 6, 0) == (1, 1, 3, 0, 0)
+
+    # FileLineFeeder does not feed blank lines, but counts them.
+    with tempfile.NamedTemporaryFile("w+b") as f:
+        f.write(b"a\n\n\nbc\nd")
+        f.flush()
+        f.seek(0)
+        for feeder in (MappedFileLineFeeder(f), FileLineFeeder(open(f.name))):
+            feeder.track_line_starts()
+            assert "".join(iter(feeder.feed, "")) == "a\nbc\nd"
+            line_starts = feeder.line_starts
+            assert [line_starts.position_to_line_col(pos) for pos in range(6)] == [
+                (0, 0),
+                (0, 1),
+                (3, 0),
+                (3, 1),
+                (3, 2),
+                (4, 0),
+            ]
+            feeder.fileobject.close()
+
+
+def test_line_starts_kept(monkeypatch):
+    """Line starts are recorded when asked for, and can be discarded"""
+    feeder = MultiLineFeeder("a\nb\n", "<test_line_starts>", ContainerKind.STRING)
+    feeder.feed()
+    assert feeder.line_starts is None
+
+    monkeypatch.setattr(location, "TRACK_LOCATIONS", True)
+    feeder = MultiLineFeeder(
+        "a\nbc\nd\n",
+        "<test_line_starts>",
+        ContainerKind.STRING,
+        SourceRetention.STATEMENT,
+    )
+    feeder.feed()
+    feeder.feed()
+    line_starts = feeder.line_starts
+    assert line_starts.position_to_line_col(0) == (0, 0)
+    feeder.start_statement()
+    assert line_starts.position_to_line_col(3) == (1, 1)
+    with pytest.raises(ValueError):
+        line_starts.position_to_line_col(1)
+    feeder.feed()
+    assert line_starts.position_to_line_col(6) == (2, 1)
+    assert len(line_starts.starts) <= 2
+
+
+def test_line_starts_discard():
+    """Discarded line starts are dropped from the arrays in bulk"""
+    line_starts = LineStarts()
+    for line_number in range(100):
+        line_starts.add("ab\n", line_number)
+        line_starts.discard(3 * line_number + 1)
+        assert len(line_starts.starts) <= 2 * 2
+        assert line_starts.position_to_line_col(3 * line_number + 2) == (
+            line_number,
+            2,
+        )
+    line_starts.discard(0)
+    assert line_starts.position_to_line_col(297) == (99, 0)
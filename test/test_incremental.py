@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for re-tokenization of edited source text.
+"""
+
+import random
+
+import pytest
+
+from mathics_scanner import incremental as incremental_module
+from mathics_scanner.errors import IncompleteSyntaxError, SyntaxError
+from mathics_scanner.feed import SingleLineFeeder
+from mathics_scanner.incremental import IncrementalTokeniser
+from mathics_scanner.location import ContainerKind
+from mathics_scanner.tokeniser import Tokeniser
+
+SOURCE_TEXT = (
+    'f[x_] := x^2 (* square *) + "a string" ;\n'
+    "Get[<< file.m]; 1.5`3 * 2^^101 ..\n"
+    "x = . ; Names[a*b] ?? Plus\n"
+)
+
+PIECES = ["a", "1", ".", "=", " ", '"', "(*", "*)", "<<", "[", "]", "\\", "\n"]
+
+
+def tokens_before_error(source_text):
+    """Return the tokens of ``source_text`` up to any SyntaxError, and the
+    error or None"""
+    tokens = []
+    tokeniser = Tokeniser(
+        SingleLineFeeder(source_text, "<incremental>", ContainerKind.STRING)
+    )
+    try:
+        for token in tokeniser:
+            tokens.append(token)
+    except SyntaxError as error:
+        return tokens, error
+    return tokens, None
+
+
+def check_edit(text, offset, deleted, inserted):
+    incremental = IncrementalTokeniser(text)
+    old_tokens = list(incremental.tokens)
+    new_text = text[:offset] + inserted + text[offset + deleted :]
+    expected, error = tokens_before_error(new_text)
+
+    first, last, new_tokens = incremental.edit(offset, deleted, inserted)
+    assert incremental.source_text == new_text
+    assert incremental.tokens == expected, (text, offset, deleted, inserted)
+    assert type(incremental.error) is type(error)
+    assert incremental.tokens[first : first + len(new_tokens)] == new_tokens
+    assert old_tokens[:first] == expected[:first]
+    assert len(old_tokens) - last == len(expected) - first - len(new_tokens)
+
+
+def test_edits():
+    check_edit("ab cd", 2, 0, "c")
+    check_edit("1.. x", 2, 1, "y")
+    check_edit("x = y", 4, 1, ".")
+    check_edit("a (* b *) c", 3, 0, "(*")
+    check_edit('a "b" c', 2, 0, '"')
+    check_edit("<< a.m; b", 3, 1, "c")
+    check_edit("2^^ x", 3, 0, "1")
+
+
+def test_random_edits():
+    rand = random.Random(11)
+    for _ in range(300):
+        offset = rand.randrange(len(SOURCE_TEXT) + 1)
+        deleted = rand.randrange(min(4, len(SOURCE_TEXT) - offset) + 1)
+        inserted = "".join(rand.choice(PIECES) for _ in range(rand.randrange(3)))
+        check_edit(SOURCE_TEXT, offset, deleted, inserted)
+
+
+def test_edit_scans_locally():
+    incremental = IncrementalTokeniser("x + " * 1000 + "y")
+    first, last, new_tokens = incremental.edit(2000, 1, "zz")
+    assert last - first <= 6
+    assert len(new_tokens) <= 6
+    assert incremental.tokens[-1].pos == 4001
+
+
+def test_sequential_edits(monkeypatch):
+    # Small chunks, so that edits split, merge and cross chunks.
+    monkeypatch.setattr(incremental_module, "CHUNK_SIZE", 2)
+    rand = random.Random(12)
+    text = "".join(SOURCE_TEXT.splitlines(True)[:2]) * 4 + SOURCE_TEXT
+    incremental = IncrementalTokeniser(text)
+    for _ in range(300):
+        offset = rand.randrange(len(text) + 1)
+        deleted = rand.randrange(min(4, len(text) - offset) + 1)
+        inserted = "".join(rand.choice(PIECES) for _ in range(rand.randrange(3)))
+        text = text[:offset] + inserted + text[offset + deleted :]
+        expected, error = tokens_before_error(text)
+        incremental.edit(offset, deleted, inserted)
+        assert incremental.tokens == expected
+        assert len(incremental) == len(expected)
+        if expected:
+            assert incremental[-1] == expected[-1]
+        assert type(incremental.error) is type(error)
+
+
+def test_incomplete_edit():
+    """An edit that leaves text that cannot be scanned to the end is made,
+    and the tokens before the error are kept"""
+    incremental = IncrementalTokeniser("f[x] + g[y]")
+    incremental.edit(7, 0, '"')
+    assert incremental.source_text == 'f[x] + "g[y]'
+    assert isinstance(incremental.error, IncompleteSyntaxError)
+    assert [token.text for token in incremental] == ["f", "[", "x", "]", "+"]
+
+    first, last, new_tokens = incremental.edit(12, 0, '"')
+    assert incremental.error is None
+    assert incremental.tokens[-1].text == '"g[y]"'
+    assert incremental.tokens[first:] == new_tokens
+
+    incremental = IncrementalTokeniser("a (* b")
+    assert isinstance(incremental.error, IncompleteSyntaxError)
+    assert [token.text for token in incremental] == ["a"]
+
+
+def test_edit_keeps_later_chunks():
+    incremental = IncrementalTokeniser("x + " * 5000 + "y")
+    last_chunk = incremental._chunks[-1]
+    last_tokens = list(last_chunk.tokens)
+    incremental.edit(10, 1, "zz")
+    # The chunks after the edit were moved without building their tokens
+    # again.
+    assert incremental._chunks[-1] is last_chunk
+    assert all(a is b for a, b in zip(last_chunk.tokens, last_tokens))
+    assert incremental[-1].pos == 20001
+
+
+def test_edit_out_of_range():
+    with pytest.raises(ValueError):
+        IncrementalTokeniser("abc").edit(2, 2, "")
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for container ids and for locations packed into a single int.
+"""
+
+import random
+import sys
+import tempfile
+import threading
+from array import array
+
+import pytest
+
+from mathics_scanner import location
+from mathics_scanner.feed import FileLineFeeder, MultiLineFeeder, SingleLineFeeder
+from mathics_scanner.location import (
+    PACKED_COLUMN_MAX,
+    ContainerKind,
+    ContainerRegistry,
+    SourceRange,
+    get_location_file_line,
+    pack_location,
+    pack_source_range,
+    unpack_location,
+)
+
+
+def test_pack_location():
+    for container, line, column in (
+        (0, 0, 0),
+        (3, 1000, 75),
+        (2**20 - 1, 2**28 - 1, PACKED_COLUMN_MAX),
+    ):
+        packed = pack_location(container, line, column)
+        assert unpack_location(packed) == (container, line, column)
+        # Packed locations fit in 64 bits.
+        assert array("Q", [packed])[0] == packed
+
+    assert unpack_location(pack_location(1, 2, PACKED_COLUMN_MAX + 10)) == (
+        1,
+        2,
+        PACKED_COLUMN_MAX,
+    )
+    for container, line, column in (
+        (-1, 0, 0),
+        (2**20, 0, 0),
+        (0, 2**28, 0),
+        (0, 0, -1),
+    ):
+        with pytest.raises(ValueError):
+            pack_location(container, line, column)
+
+    assert unpack_location(pack_source_range(SourceRange(4, 5, 6, 7, 8))) == (8, 4, 5)
+
+
+def test_packed_file_line(monkeypatch):
+    monkeypatch.setattr(location, "MATHICS3_PATHS", ["a.m", "b.m"])
+    assert get_location_file_line(pack_location(1, 41, 3)) == ("b.m", 41)
+    assert get_location_file_line(SourceRange(41, 3, 41, 5, 1)) == ("b.m", 41)
+
+    feeder = MultiLineFeeder("x\ny = 1\n", "<packed>", ContainerKind.STRING)
+    feeder.track_line_starts()
+    while feeder.feed():
+        pass
+    assert unpack_location(feeder.line_starts.packed_location(6, 1)) == (1, 1, 4)
+
+
+def test_container_registry():
+    paths = ["a.m"]
+    registry = ContainerRegistry(paths, max_transient=2)
+    assert registry.register("a.m") == 0
+    assert registry.register("b.m") == 1
+    assert registry.register("b.m") == 1
+    assert registry.register("<s1>", ContainerKind.STRING) == 2
+    assert registry.register("<s2>", ContainerKind.STREAM) == 3
+    assert registry.register("<s1>", ContainerKind.STRING) == 2
+    assert registry.register("<s3>", ContainerKind.STRING) == 4
+
+    # <s2> was the least recently registered, so it has been forgotten,
+    # and its id is not used again.
+    assert paths == ["a.m", "b.m", "<s1>", None, "<s3>"]
+    assert registry.path(3) is None
+    assert len(registry) == 4
+    assert registry.register("<s2>", ContainerKind.STREAM) == 5
+    assert registry.path(5) == "<s2>"
+    assert paths[2] is None
+
+
+@pytest.mark.skipif(sys.platform == "emscripten", reason="Pyodide cannot start threads")
+def test_container_registry_threads():
+    paths = []
+    registry = ContainerRegistry(paths)
+    names = [f"file{i}.m" for i in range(200)]
+    ids = []
+
+    def register_all():
+        shuffled = random.sample(names, len(names))
+        ids.append({name: registry.register(name) for name in shuffled})
+
+    threads = [threading.Thread(target=register_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(paths) == sorted(names)
+    for name_ids in ids:
+        assert name_ids == ids[0]
+        assert all(
+            paths[container_id] == name for name, container_id in name_ids.items()
+        )
+
+
+def test_feeder_container_index(monkeypatch):
+    monkeypatch.setattr(location, "TRACK_LOCATIONS", True)
+    with tempfile.NamedTemporaryFile("w+") as f:
+        first = FileLineFeeder(f)
+        second = FileLineFeeder(f)
+        assert first.container_index == second.container_index >= 0
+        assert location.MATHICS3_PATHS[first.container_index] == f.name
+
+    # STREAM and STRING containers are registered too, as transient ones,
+    # of which only so many are kept.
+    assert location.CONTAINERS.max_transient == location.MAX_TRANSIENT_CONTAINERS
+    monkeypatch.setattr(location, "MATHICS3_PATHS", [])
+    monkeypatch.setattr(
+        location,
+        "CONTAINERS",
+        ContainerRegistry(location.MATHICS3_PATHS, max_transient=2),
+    )
+    stream = MultiLineFeeder("x\n", "<stdin>", ContainerKind.STREAM)
+    string = SingleLineFeeder("x", "<string>", ContainerKind.STRING)
+    assert location.MATHICS3_PATHS == ["<stdin>", "<string>"]
+    assert (stream.container_index, string.container_index) == (0, 1)
+    assert MultiLineFeeder("y\n", "<stdin>", ContainerKind.STREAM).container_index == 0
+    SingleLineFeeder("x", "<other>", ContainerKind.STRING)
+    assert location.MATHICS3_PATHS == ["<stdin>", None, "<other>"]
+    assert get_location_file_line(pack_location(1, 4, 0)) == (None, 4)
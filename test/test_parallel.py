@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for tokenizing many files in a pool of processes.
+"""
+
+import sys
+
+import pytest
+
+import mathics_scanner
+from mathics_scanner.errors import IncompleteSyntaxError
+from mathics_scanner.feed import DETECTION_BLOCK_SIZE
+from mathics_scanner.parallel import tokenize_file
+from mathics_scanner.token_cache import TokenCache
+from mathics_scanner.tokeniser import Token
+
+
+@pytest.mark.skipif(
+    sys.platform == "emscripten", reason="Pyodide cannot start processes"
+)
+def test_tokenize_files(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"file{i}.m"
+        path.write_text(f"f[x_] := x + {i}\ng[{i}]\n")
+        paths.append(str(path))
+    bad_path = tmp_path / "bad.m"
+    bad_path.write_text('a = "unterminated\n')
+    paths.insert(3, str(bad_path))
+    latin1_path = tmp_path / "latin1.m"
+    latin1_path.write_bytes(
+        '"caf\u00e9 cr\u00e8me br\u00fbl\u00e9e"\n'.encode("latin-1")
+    )
+    paths.append(str(latin1_path))
+    # Invalid UTF-8 after the block that the encoding is detected from.
+    undecodable_path = tmp_path / "undecodable.m"
+    undecodable_path.write_bytes(b"x\n" * DETECTION_BLOCK_SIZE + b"\xff\n")
+    paths.append(str(undecodable_path))
+    paths.append(str(tmp_path / "missing.m"))
+
+    results = mathics_scanner.tokenize_files(paths, workers=2)
+    assert [result.path for result in results] == paths
+    for result, expected in zip(results, map(tokenize_file, paths)):
+        assert result.tokens == expected.tokens
+        assert result.messages == expected.messages
+        assert repr(result.error) == repr(expected.error)
+
+    assert results[0].tokens[-4:] == [
+        Token("Symbol", "g", 15),
+        Token("RawLeftBracket", "[", 16),
+        Token("Number", "0", 17),
+        Token("RawRightBracket", "]", 18),
+    ]
+    assert results[0].error is None
+    assert results[0].messages == []
+
+    bad = results[3]
+    assert bad.tokens == [Token("Symbol", "a", 0), Token("Set", "=", 2)]
+    assert isinstance(bad.error, IncompleteSyntaxError)
+    assert bad.error.args[0] == "sntxi"
+    assert bad.messages[0][:2] == ["Syntax", "sntxi"]
+
+    # Files that cannot be decoded or read do not stop the others.
+    latin1, undecodable, missing = results[-3:]
+    assert latin1.tokens == [
+        Token("String", '"caf\u00e9 cr\u00e8me br\u00fbl\u00e9e"', 19)
+    ]
+    assert latin1.error is None
+    assert isinstance(undecodable.error, UnicodeDecodeError)
+    assert undecodable.tokens[-1].text == "x"
+    assert isinstance(missing.error, FileNotFoundError)
+    assert missing.tokens == []
+
+
+def test_tokenize_files_in_process(tmp_path, monkeypatch):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"file{i}.m"
+        path.write_text(f"x + {i}\n")
+        paths.append(str(path))
+    # Under Pyodide, no processes are started.
+    monkeypatch.setattr(sys, "platform", "emscripten")
+    results = mathics_scanner.tokenize_files(paths, workers=2)
+    assert [result.tokens for result in results] == [
+        tokenize_file(path).tokens for path in paths
+    ]
+
+
+def test_tokenize_file_unreadable(tmp_path):
+    path = tmp_path / "undecodable.m"
+    path.write_bytes(b"x\n" * DETECTION_BLOCK_SIZE + b"\xff\n")
+    cache = TokenCache(str(tmp_path / "cache"))
+    result = tokenize_file(str(path), cache)
+    assert isinstance(result.error, UnicodeDecodeError)
+    # Failures to decode are not cached.
+    assert not (tmp_path / "cache").exists()
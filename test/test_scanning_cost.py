@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Regression benchmarks checking that scanning cost grows linearly with
+the size of the input.
+
+Some benchmarks compare the time for a fixed group of tokens, scanned
+with and without a large trailing token that is matched in a single
+regular-expression call. If the cost of a token depended on the
+amount of input after it, the large trailing token would show up
+in the time for the group.
+
+Others compare the time to scan a single large token with the time
+to scan one that is a fraction of that size.
+"""
+
+import time
+
+from mathics_scanner.feed import MultiLineFeeder, SingleLineFeeder
+from mathics_scanner.location import ContainerKind
+from mathics_scanner.tokeniser import Tokeniser
+
+# A bound on the ratio of times that is generous enough to avoid
+# spurious failures from timing noise, but is still well below what we
+# get when per-token cost grows with the input size.
+MAX_COST_RATIO = 3.0
+
+
+def scan_time(
+    source_text: str, repeat: int = 3, feeder_class=SingleLineFeeder
+) -> float:
+    """Return the best time over ``repeat`` runs to scan all of
+    ``source_text``"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Tokeniser(
+            feeder_class(source_text, "<scan_time>", ContainerKind.STRING)
+        ).tokenize_all()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_flat_cost(prefix: str, small_suffix: str, big_suffix: str):
+    small_input_time = scan_time(prefix + small_suffix)
+    big_input_time = scan_time(prefix + big_suffix) - scan_time(big_suffix)
+    assert big_input_time < MAX_COST_RATIO * small_input_time, (
+        f"scanning {prefix[:10]!r}... took {big_input_time:.4f}s before "
+        f"{len(big_suffix)} characters, "
+        f"but {small_input_time:.4f}s before {len(small_suffix)}"
+    )
+
+
+def check_linear_cost(
+    source_text_fn, size: int, scale: int = 8, feeder_class=SingleLineFeeder
+):
+    small_input_time = scan_time(source_text_fn(size), feeder_class=feeder_class)
+    big_input_time = scan_time(source_text_fn(size * scale), feeder_class=feeder_class)
+    assert big_input_time < MAX_COST_RATIO * scale * small_input_time, (
+        f"scanning {source_text_fn(1)!r} at size {size * scale} took "
+        f"{big_input_time:.4f}s, but {small_input_time:.4f}s at size {size}"
+    )
+
+
+def test_multiline_cost():
+    """Cost should be linear in the number of lines of input"""
+    check_linear_cost(
+        lambda n: "{" + "1, 2,\n" * n + "3}", 2_000, feeder_class=MultiLineFeeder
+    )
+    check_linear_cost(
+        lambda n: '"' + "abc\n" * n + '"', 2_000, feeder_class=MultiLineFeeder
+    )
+    check_linear_cost(
+        lambda n: "(*" + "abc\n" * n + "*)", 2_000, feeder_class=MultiLineFeeder
+    )
+
+
+def test_string_cost():
+    """String cost should be linear in the length of the String"""
+    check_linear_cost(lambda n: '"' + "abcdefgh" * n + '"', 50_000)
+    check_linear_cost(lambda n: '"' + 'ab\\ncd\\"e\\tf' * n + '"', 5_000)
+
+
+def test_symbol_cost():
+    """Symbol cost should not depend on how much input follows it"""
+    check_flat_cost("a " * 2000, "1", "1" * 2_000_000)
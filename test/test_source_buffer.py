@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for SourceBuffer, source text kept as a list of segments.
+"""
+
+from mathics_scanner.source_buffer import SourceBuffer
+
+
+def test_source_buffer():
+    lines = ["abc\n", "\n", "de\n", "fghi"]
+    source_text = "".join(lines)
+    buffer = SourceBuffer()
+    for line in lines:
+        buffer.append(line)
+
+    assert len(buffer) == len(source_text)
+    assert buffer.starts == [0, 4, 5, 8]
+    assert buffer.segment_index(0) == 0
+    assert buffer.segment_index(4) == 1
+    assert buffer.segment_index(7) == 2
+    for start in range(len(source_text) + 1):
+        for end in range(start, len(source_text) + 2):
+            assert buffer.text(start, end) == source_text[start:end], (start, end)
+    assert buffer.text(6) == source_text[6:]
+    assert str(buffer) == source_text
+
+    buffer.append("jk")
+    assert str(buffer) == source_text + "jk"
+    assert buffer.text(10) == "hijk"
+
+    # Offsets are kept when segments are discarded.
+    buffer.discard(7)
+    assert buffer.start == 5
+    assert buffer.segments == ["de\n", "fghi", "jk"]
+    assert buffer.text(6) == "e\nfghijk"
+    assert buffer.text(0, 7) == "de"
+    assert str(buffer) == "de\nfghijk"
+    assert buffer.text(6, 9) == "e\nf"
+    buffer.discard(len(buffer))
+    assert buffer.segments == [] and buffer.start == len(buffer) == 14
+    buffer.append("l")
+    assert buffer.text(10) == "l"
@@ -8,7 +8,7 @@ from typing import Optional
 import pytest
 
 from mathics_scanner.errors import EscapeSyntaxError, IncompleteSyntaxError
-from mathics_scanner.feed import SingleLineFeeder
+from mathics_scanner.feed import MultiLineFeeder, SingleLineFeeder
 from mathics_scanner.location import ContainerKind
 from mathics_scanner.tokeniser import Token, Tokeniser
 
@@ -145,3 +145,12 @@ def test_hexadecimal_colon():
 
 def test_hexadecimal_vbar():
     check_string(r'"\|01D451"', '"\U0001d451"')
+
+
+def test_multiline_string():
+    tokeniser = Tokeniser(
+        MultiLineFeeder(
+            ['"abc\n', "def\\", 'n ghi"'], "<multiline_string>", ContainerKind.STRING
+        )
+    )
+    assert tokeniser.tokenize_all() == [Token("String", '"abc\ndef\n ghi"', 15)]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the column-oriented TokenBuffer.
+"""
+
+import pytest
+
+from mathics_scanner.feed import MultiLineFeeder
+from mathics_scanner.location import ContainerKind
+from mathics_scanner.token_buffer import TokenBuffer
+from mathics_scanner.tokeniser import StreamingTokeniser, Token, Tokeniser
+
+
+def token_buffer(source_text: str) -> TokenBuffer:
+    return TokenBuffer.from_tokeniser(
+        Tokeniser(MultiLineFeeder(source_text, "<token_buffer>", ContainerKind.STRING))
+    )
+
+
+def tokens(source_text: str):
+    return Tokeniser(
+        MultiLineFeeder(source_text, "<tokens>", ContainerKind.STRING)
+    ).tokenize_all()
+
+
+def test_same_as_tokens():
+    for source_text in (
+        "f[x_] := x^2 /; x > 0",
+        "a = 1\n(* comment\n *) b\n",
+        '"a\\tb" <> "c\\"d"',
+        "x\\[Mu]y + \\[Theta]",
+        "1.. + 2.5`10",
+        "<< file.m",
+        "",
+    ):
+        buffer = token_buffer(source_text)
+        assert list(buffer) == tokens(source_text), source_text
+
+
+def test_accessors():
+    buffer = token_buffer('abc + "d\\ne"')
+    assert len(buffer) == 3
+    assert [buffer.tag(i) for i in range(3)] == ["Symbol", "Plus", "String"]
+    assert (buffer.start(0), buffer.end(0)) == (0, 3)
+    assert buffer.text(0) == "abc"
+    assert buffer.text(-1) == '"d\ne"'
+    assert buffer[1] == Token("Plus", "+", 4)
+    assert buffer.tag_names == ["Symbol", "Plus", "String"]
+
+
+def test_string_rows():
+    """The row of a String spans its source text, which is sliced lazily"""
+    buffer = token_buffer('x = "hello world"; y = (* c *) "a\n b"')
+    assert (buffer.start(2), buffer.end(2)) == (4, 17)
+    assert (buffer.start(6), buffer.end(6)) == (31, 37)
+    assert buffer._texts == {}
+    assert buffer[2] == Token("String", '"hello world"', 17)
+    assert buffer.text(6) == '"a\n b"'
+
+    # Escape sequences are replaced, so that text is kept.
+    buffer = token_buffer('"a\\tb"')
+    assert (buffer.start(0), buffer.end(0)) == (0, 6)
+    assert buffer.text(0) == '"a\tb"'
+
+    buffer = TokenBuffer('x = "s"')
+    buffer.append(Token("String", '"s"', 7))
+    assert (buffer.start(0), buffer.end(0)) == (4, 7)
+    assert buffer._texts == {}
+
+    # With escape sequences replaced, the start of a String cannot be
+    # worked out from where it ends.
+    source_text = 'x = "a\\tb"'
+    buffer = TokenBuffer(source_text)
+    tokeniser = Tokeniser(
+        MultiLineFeeder(source_text, "<append>", ContainerKind.STRING)
+    )
+    token, start, end = list(tokeniser.spans())[-1]
+    with pytest.raises(ValueError):
+        buffer.append(token)
+    buffer.append(token, end, start)
+    assert (buffer.start(0), buffer.end(0)) == (4, 10)
+    assert buffer[0] == token
+
+
+def test_streaming_rejected():
+    tokeniser = StreamingTokeniser(
+        MultiLineFeeder("a\nb\n", "<streaming>", ContainerKind.STRING)
+    )
+    with pytest.raises(ValueError):
+        TokenBuffer.from_tokeniser(tokeniser)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the on-disk token cache.
+"""
+
+import os
+
+from mathics_scanner import parallel
+from mathics_scanner.errors import IncompleteSyntaxError
+from mathics_scanner.parallel import tokenize_file
+from mathics_scanner.token_cache import CACHE_ENTRY_SUFFIX, TokenCache
+
+
+def test_warm_start(tmp_path, monkeypatch):
+    path = tmp_path / "a.m"
+    path.write_text('f[x_] := x^2 + "s"\r\ng[1.5]\n')
+    cache = TokenCache(str(tmp_path / "cache"))
+
+    cold = tokenize_file(str(path), cache)
+    assert cold.tokens == tokenize_file(str(path)).tokens
+    entries = os.listdir(cache.directory)
+    assert len(entries) == 1 and entries[0].endswith(CACHE_ENTRY_SUFFIX)
+
+    def no_scanning(*args):
+        raise AssertionError("the file should not be scanned again")
+
+    monkeypatch.setattr(parallel, "_tokenize_fileobject", no_scanning)
+    warm = tokenize_file(str(path), cache)
+    assert warm == cold
+
+    # A change to the file gives a new entry.
+    monkeypatch.undo()
+    path.write_text("f[y]\n")
+    assert [token.text for token in tokenize_file(str(path), cache).tokens] == [
+        "f",
+        "[",
+        "y",
+        "]",
+    ]
+    assert len(os.listdir(cache.directory)) == 2
+
+
+def test_cached_error(tmp_path):
+    path = tmp_path / "bad.m"
+    path.write_text('a = "unterminated\n')
+    cache = TokenCache(str(tmp_path / "cache"))
+    cold = tokenize_file(str(path), cache)
+    warm = tokenize_file(str(path), cache)
+    assert warm.tokens == cold.tokens
+    assert warm.messages == cold.messages
+    assert isinstance(warm.error, IncompleteSyntaxError)
+    assert repr(warm.error) == repr(cold.error)
+    assert warm.error.tag == cold.error.tag
+
+
+def test_bad_entry(tmp_path):
+    path = tmp_path / "a.m"
+    path.write_text("a + b\n")
+    cache = TokenCache(str(tmp_path / "cache"))
+    key = cache.key(str(path), path.read_bytes())
+    assert cache.load(key) is None
+    os.makedirs(cache.directory)
+    with open(cache.entry_path(key), "wb") as entry_file:
+        entry_file.write(b"not an entry")
+    assert cache.load(key) is None
+    assert len(tokenize_file(str(path), cache).tokens) == 3
+    assert cache.load(key) is not None
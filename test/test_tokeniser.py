@@ -3,21 +3,39 @@
 Tests translation from strings to sequences of tokens.
 """
 
+import pickle
 import random
 import sys
 from typing import List
 
 import pytest
 
+from mathics_scanner import tokeniser as tokeniser_module
 from mathics_scanner.errors import (
     EscapeSyntaxError,
     IncompleteSyntaxError,
     InvalidSyntaxError,
     SyntaxError,
 )
-from mathics_scanner.feed import MultiLineFeeder, SingleLineFeeder
+from mathics_scanner.feed import (
+    FileLineFeeder,
+    LineFeeder,
+    MultiLineFeeder,
+    SingleLineFeeder,
+    SourceRetention,
+)
 from mathics_scanner.location import ContainerKind
-from mathics_scanner.tokeniser import Token, Tokeniser, is_symbol_name
+from mathics_scanner.tokeniser import (
+    GROUP_TAGS,
+    StreamingTokeniser,
+    SymbolTable,
+    Token,
+    Tokeniser,
+    compile_alternation,
+    compile_pattern,
+    is_symbol_name,
+    tokenize,
+)
 
 
 def check_number(source_code: str):
@@ -127,6 +145,29 @@ def test_backslash_named_character():
     incomplete_error("\\")
 
 
+def test_alternation(monkeypatch):
+    """A combined pattern matches as the patterns do one at a time, even
+    when a tag has several patterns"""
+    # Keep the group names of this pattern out of the module's table.
+    monkeypatch.setattr(tokeniser_module, "GROUP_TAGS", dict(GROUP_TAGS))
+    pattern = compile_alternation(
+        [
+            ("Box", compile_pattern(r" \\\` ")),
+            ("Plus", compile_pattern(r" \+ ")),
+            ("Box", compile_pattern(r" \` ")),
+        ]
+    )
+    for text, tag, end in (("\\`", "Box", 2), ("+", "Plus", 1), ("`", "Box", 1)):
+        pattern_match = pattern.match(text)
+        assert (
+            tokeniser_module.GROUP_TAGS.get(
+                pattern_match.lastgroup, pattern_match.lastgroup
+            )
+            == tag
+        )
+        assert pattern_match.end() == end
+
+
 def test_boxes():
     assert tokens("\\(1\\)") == [
         Token("LeftRowBox", "\\(", 0),
@@ -158,6 +199,45 @@ def test_comments():
     assert tokens("(* A (* nested comment *) *)") == [], "A nested comment"
     assert tokens(r"(* A \[theta] *)") == [], "Comment with valid escape sequence"
     assert tokens(r"(* A \[unknown] *)") == [], "Comment with invalid escape sequence"
+    incomplete_error("(* A (* nested *) unterminated comment")
+
+
+def test_multiline_comments():
+    source_code = "a (* A (*\n nested *)\n multi-line\n comment *) b\n"
+    tokenizer = Tokeniser(
+        MultiLineFeeder(source_code, "<mlcomments>", ContainerKind.STRING)
+    )
+    assert tokenizer.tokenize_all() == [
+        Token("Symbol", "a", 0),
+        Token("Symbol", "b", 45),
+    ]
+
+
+def test_divide_family():
+    """All of the candidates for "/" are tried in priority order"""
+    assert tags("a //@ b /@ c /= d //. e /. f /* g // h /: i /; j / k") == [
+        "Symbol",
+        "MapAll",
+        "Symbol",
+        "Map",
+        "Symbol",
+        "DivideBy",
+        "Symbol",
+        "ReplaceRepeated",
+        "Symbol",
+        "ReplaceAll",
+        "Symbol",
+        "RightComposition",
+        "Symbol",
+        "Postfix",
+        "Symbol",
+        "TagSet",
+        "Symbol",
+        "Condition",
+        "Symbol",
+        "Divide",
+        "Symbol",
+    ]
 
 
 def test_function():
@@ -195,6 +275,19 @@ def test_integeral():
     ]
 
 
+def test_iter():
+    feeder = MultiLineFeeder("a + b\nc\n", "<iter>", ContainerKind.STRING)
+    token_iter = iter(Tokeniser(feeder))
+    assert next(token_iter) == Token("Symbol", "a", 0)
+    assert feeder.lineno == 1, "The second line has not been read yet"
+    assert list(token_iter) == [
+        Token("Plus", "+", 2),
+        Token("Symbol", "b", 4),
+        Token("Symbol", "c", 6),
+    ]
+    assert feeder.lineno == 2
+
+
 def test_is_symbol():
     assert is_symbol_name("Derivative")
     assert not is_symbol_name("98")  # symbols can't start with numbers
@@ -218,12 +311,66 @@ def test_multiline_backslash():
     assert tokenizer.feeder.empty(), "Feeder should note two two lines have been read"
 
 
+def test_more_input():
+    """Reading more input the way the parser does for an incomplete expression"""
+    tokenizer = Tokeniser(
+        MultiLineFeeder("f[a,\n b]\n", "<more_input>", ContainerKind.STRING)
+    )
+    assert multiline_tokens(tokenizer) == [
+        Token("Symbol", "f", 0),
+        Token("RawLeftBracket", "[", 1),
+        Token("Symbol", "a", 2),
+        Token("RawComma", ",", 3),
+    ]
+    end_pos = tokenizer.pos
+    tokenizer.get_more_input()
+    tokenizer.pos = end_pos
+    assert multiline_tokens(tokenizer) == [
+        Token("Symbol", "b", 6),
+        Token("RawRightBracket", "]", 7),
+    ]
+    assert str(tokenizer.source_buffer) == "f[a,\n b]\n"
+
+    # Going back to text before the scanning window.
+    tokenizer.pos = 2
+    assert multiline_tokens(tokenizer) == [
+        Token("Symbol", "a", 2),
+        Token("RawComma", ",", 3),
+        Token("Symbol", "b", 6),
+        Token("RawRightBracket", "]", 7),
+    ]
+
+
 def test_number():
     assert tags("1.5") == ["Number"]
     assert tags("1.5*^10") == ["Number"]
     check_number("0")
 
 
+def test_number_plain():
+    """Plain numbers, and plain numbers followed by text that continues them"""
+    assert tokens("{12, 3.25, 4.}") == [
+        Token("OpenCurly", "{", 0),
+        Token("Number", "12", 1),
+        Token("RawComma", ",", 3),
+        Token("Number", "3.25", 5),
+        Token("RawComma", ",", 9),
+        Token("Number", "4.", 11),
+        Token("CloseCurly", "}", 13),
+    ]
+    assert tokens("2^^101 1.5`10 3*^2 12*3 2^3") == [
+        Token("Number", "2^^101", 0),
+        Token("Number", "1.5`10", 7),
+        Token("Number", "3*^2", 14),
+        Token("Number", "12", 19),
+        Token("Times", "*", 21),
+        Token("Number", "3", 22),
+        Token("Number", "2", 24),
+        Token("Power", "^", 25),
+        Token("Number", "3", 26),
+    ]
+
+
 def test_number_base():
     check_number("8^^23")
     check_number("10*^3")
@@ -243,6 +390,65 @@ def test_number_real():
     check_number("0.0")
 
 
+def test_peek():
+    tokenizer = Tokeniser(SingleLineFeeder("a + << b; c", "<peek>"))
+    assert tokenizer.peek() == Token("Symbol", "a", 0)
+    assert tokenizer.peek(2) == Token("Get", "<<", 4)
+    assert tokenizer.pos == 0
+    assert tokenizer.advance() == Token("Symbol", "a", 0)
+    assert tokenizer.pos == 1
+    assert tokenizer.peek(2) == Token("Filename", "b", 7)
+    assert tokenizer.next() == Token("Plus", "+", 2)
+
+    # The next token was scanned in "expr" mode, so it is kept.
+    tokenizer.change_token_scanning_mode("expr")
+    assert tokenizer.peek(1) == Token("Filename", "b", 7)
+
+    # "b" was scanned as a file name, so it is scanned again as a Symbol.
+    assert tokenizer.advance() == Token("Get", "<<", 4)
+    tokenizer.change_token_scanning_mode("expr")
+    assert tokenizer.advance() == Token("Symbol", "b", 7)
+    assert tokenizer.peek(2) == Token("END", "", 11)
+    assert [tokenizer.advance() for _ in range(3)] == [
+        Token("Semicolon", ";", 8),
+        Token("Symbol", "c", 10),
+        Token("END", "", 11),
+    ]
+
+    tokenizer.pos = 2
+    assert tokenizer.advance() == Token("Plus", "+", 2)
+    with pytest.raises(ValueError):
+        tokenizer.peek(Tokeniser.LOOKAHEAD_SIZE)
+
+
+def test_position_to_line_col():
+    feeder = MultiLineFeeder('f[x,\n  "y\nz"]\ng\n', "<lines>", ContainerKind.STRING)
+    with pytest.raises(ValueError):
+        Tokeniser(feeder).position_to_line_col(0)
+
+    feeder = MultiLineFeeder('f[x,\n  "y\nz"]\ng\n', "<lines>", ContainerKind.STRING)
+    feeder.track_line_starts()
+    tokenizer = Tokeniser(feeder)
+    tokens = multiline_tokens(tokenizer)
+    tokenizer.get_more_input()
+    tokens += multiline_tokens(tokenizer)
+    assert [tokenizer.position_to_line_col(token.pos) for token in tokens] == [
+        (0, 0),
+        (0, 1),
+        (0, 2),
+        (0, 3),
+        # The position of a String is where it ends.
+        (2, 2),
+        (2, 2),
+    ]
+    assert tokenizer.source_range(7, 10) == (1, 2, 2, 0, -1)
+
+    # Positions start again for a new tokeniser on the same feeder.
+    tokenizer = Tokeniser(feeder)
+    assert tokenizer.next() == Token("Symbol", "g", 0)
+    assert tokenizer.position_to_line_col(0) == (3, 0)
+
+
 def test_pre():
     assert tokens("++x++") == [
         Token("Increment", "++", 0),
@@ -283,11 +489,250 @@ def test_set():
     ]
 
 
+def test_snapshot():
+    tokenizer = Tokeniser(
+        MultiLineFeeder("a + << b\n c]\n", "<snapshot>", ContainerKind.STRING)
+    )
+    assert tokenizer.next() == Token("Symbol", "a", 0)
+    state = tokenizer.snapshot()
+    assert multiline_tokens(tokenizer) == [
+        Token("Plus", "+", 2),
+        Token("Get", "<<", 4),
+        Token("Filename", "b", 7),
+    ]
+    assert tokenizer.mode == "expr"
+
+    tokenizer.restore(state)
+    assert tokenizer.next() == Token("Plus", "+", 2)
+    assert tokenizer.next() == Token("Get", "<<", 4)
+    assert tokenizer.mode == "filename"
+    tokenizer.restore(state)
+    assert tokenizer.mode == "expr"
+
+    # Input read after the snapshot is kept when going back to it.
+    tokenizer.pos = 8
+    tokenizer.get_more_input()
+    assert tokenizer.source_offset == 8
+    tokenizer.restore(state)
+    assert tokenizer.pos == 1
+    assert multiline_tokens(tokenizer) == [
+        Token("Plus", "+", 2),
+        Token("Get", "<<", 4),
+        Token("Filename", "b", 7),
+        Token("Symbol", "c", 10),
+        Token("RawRightBracket", "]", 11),
+    ]
+
+
+class RepeatingLineFeeder(LineFeeder):
+    "Feeds ``count`` lines, cycling through ``lines``, without keeping them"
+
+    def __init__(self, lines: List[str], count: int):
+        super().__init__("<repeating>")
+        self.lines = lines
+        self.count = count
+
+    def feed(self) -> str:
+        if self.lineno >= self.count:
+            return ""
+        line = self.lines[self.lineno % len(self.lines)]
+        if self.line_starts is not None:
+            self.line_starts.add(line, self.lineno)
+        self.lineno += 1
+        return line
+
+    def empty(self) -> bool:
+        return self.lineno >= self.count
+
+
+def test_streaming():
+    lines = ['f[1, "a\n', '"] (* c\n', "(* d *) *) + x;\n"]
+    source_text = "".join(lines) * 100
+    feeder = RepeatingLineFeeder(lines, 300)
+    feeder.track_line_starts()
+    tokenizer = StreamingTokeniser(feeder)
+    max_segments = max_line_starts = 0
+    streamed = []
+    for token in tokenizer:
+        streamed.append(token)
+        max_segments = max(max_segments, len(tokenizer.source_buffer.segments))
+        max_line_starts = max(max_line_starts, len(feeder.line_starts.starts))
+    assert streamed == tokenize(source_text)
+    # Only the lines of the token being scanned are kept, and where they
+    # start.
+    assert max_segments <= 2
+    assert max_line_starts <= 4
+    assert tokenizer.position_to_line_col(streamed[-2].pos) == (299, 13)
+
+    # Lines are kept while tokens looked ahead at need them.
+    lines = ['"a\n', 'b" "c\n', 'd"\n', "x\n"]
+    tokenizer = StreamingTokeniser(RepeatingLineFeeder(lines, 4))
+    state = tokenizer.snapshot()
+    assert tokenizer.peek(1) == Token("String", '"c\nd"', 11)
+    assert tokenizer.source_buffer.segments == lines[1:3]
+    tokenizer.restore(state)
+    assert [tokenizer.next() for _ in range(3)] == [
+        Token("String", '"a\nb"', 5),
+        Token("String", '"c\nd"', 11),
+        Token("END", "", 12),
+    ]
+    tokenizer.get_more_input()
+    assert tokenizer.source_buffer.segments == lines[3:]
+    with pytest.raises(ValueError):
+        tokenizer.restore(state)
+    with pytest.raises(ValueError):
+        tokenizer.pos = 0
+
+
+def test_streaming_feeder_retention(tmp_path):
+    """The feeder of a StreamingTokeniser does not keep the input either"""
+    lines = [f"x{i} + 1;\n" for i in range(1000)]
+    path = tmp_path / "streaming.m"
+    path.write_text("".join(lines))
+    with open(path) as fileobject:
+        feeder = FileLineFeeder(fileobject)
+        assert len(list(StreamingTokeniser(feeder))) == 4000
+    assert feeder.retention is SourceRetention.NONE
+    assert len(feeder.source_buffer) == 0
+
+    # Lines given as a list are not changed.
+    feeder = MultiLineFeeder(lines, "<streaming>", ContainerKind.STRING)
+    assert len(list(StreamingTokeniser(feeder))) == 4000
+    assert feeder.source_text == ""
+    assert lines[0] == "x0 + 1;\n"
+
+
 def test_symbol():
     check_symbol("xX")
     check_symbol("context`name")
     check_symbol("`name")
     check_symbol("`context`name")
+    assert tokens(r"a\[Mu]b") == [Token("Symbol", "a\u03bcb", 0)]
+
+
+def test_tokenize_all():
+    source_code = "a = 1\n(* comment\n *) b\n"
+    tokenizer = Tokeniser(
+        MultiLineFeeder(source_code, "<tokenize_all>", ContainerKind.STRING)
+    )
+    expected = [
+        Token("Symbol", "a", 0),
+        Token("Set", "=", 2),
+        Token("Number", "1", 4),
+        Token("Symbol", "b", 21),
+    ]
+    assert tokenizer.tokenize_all() == expected
+    assert tokenizer.feeder.empty()
+    assert tokenize(source_code) == expected
+    assert tokenize("") == []
+
+
+def test_subclass_rule():
+    """A subclass can add a custom tokenization rule"""
+
+    class NumberWordTokeniser(Tokeniser):
+        def t_Number(self, pattern_match) -> Token:
+            self.scan_pos = pattern_match.end(0)
+            return Token(
+                "NumberWord",
+                "n" + pattern_match.group(0),
+                self.source_offset + pattern_match.start(0),
+            )
+
+    tokeniser = NumberWordTokeniser(
+        SingleLineFeeder("12 x", "<subclass>", ContainerKind.STRING)
+    )
+    assert tokeniser.tokenize_all() == [
+        Token("NumberWord", "n12", 0),
+        Token("Symbol", "x", 3),
+    ]
+
+    # After a second line has been read, source_text no longer starts at
+    # the start of the input.
+    tokeniser = NumberWordTokeniser(
+        MultiLineFeeder('"ab\ncd" 12 x\n', "<subclass>", ContainerKind.STRING)
+    )
+    assert tokeniser.tokenize_all() == [
+        Token("String", '"ab\ncd"', 7),
+        Token("NumberWord", "n12", 8),
+        Token("Symbol", "x", 11),
+    ]
+    assert tokeniser.source_offset > 0
+    assert tokens("12") == [Token("Number", "12", 0)]
+
+
+def test_spans():
+    """spans() gives where the source text of each token starts and ends"""
+    source_text = 'f[x] (* c *)\n+ "a\\tb\nc" + \\[Mu]'
+    tokeniser = Tokeniser(MultiLineFeeder(source_text, "<spans>", ContainerKind.STRING))
+    spans = list(tokeniser.spans())
+    assert [token for token, _, _ in spans] == tokens(source_text)
+    assert [source_text[start:end] for _, start, end in spans] == [
+        "f",
+        "[",
+        "x",
+        "]",
+        "+",
+        '"a\\tb\nc"',
+        "+",
+        "\\[Mu]",
+    ]
+
+
+def test_symbol_table():
+    tokeniser = Tokeniser(
+        SingleLineFeeder(
+            "System`Plot[x] + x + \\[Mu]x + \\[Mu]x", "<symbols>", ContainerKind.STRING
+        )
+    )
+    symbols = [token.text for token in tokeniser if token.tag == "Symbol"]
+    assert symbols == ["System`Plot", "x", "x", "\u03bcx", "\u03bcx"]
+    assert symbols[1] is symbols[2]
+    assert symbols[3] is symbols[4]
+    assert tokeniser.symbol_table.split(symbols[3]) == ("", "\u03bcx")
+    assert tokeniser.symbol_table.split("System`Plot") == ("System`", "Plot")
+    assert tokeniser.symbol_table.split("x") == ("", "x")
+    assert tokeniser.symbol_table.split("`a`b") == ("`a`", "b")
+    assert len(tokeniser.symbol_table) > 0
+    tokeniser.symbol_table.clear()
+    assert len(tokeniser.symbol_table) == 0
+
+    # Each tokeniser has a table of its own, unless one is passed in.
+    other = Tokeniser(SingleLineFeeder("y", "<symbols>", ContainerKind.STRING))
+    assert other.symbol_table is not tokeniser.symbol_table
+    shared = SymbolTable()
+    assert (
+        Tokeniser(
+            SingleLineFeeder("y", "<symbols>", ContainerKind.STRING), shared
+        ).symbol_table
+        is shared
+    )
+
+
+def test_symbol_table_bounded():
+    table = SymbolTable(max_names=4)
+    for i in range(100):
+        assert table.intern(f"x{i}") == f"x{i}"
+        assert len(table) <= 4
+    assert table.split("a`b") == ("a`", "b")
+    feeder = SingleLineFeeder("a", "<symbols>", ContainerKind.STRING)
+    assert (
+        StreamingTokeniser(feeder).symbol_table.max_names
+        == StreamingTokeniser.MAX_SYMBOL_NAMES
+    )
+
+
+def test_token_record():
+    token = Token("Symbol", "x", 3)
+    assert token == Token("Sym" + "bol", "x", 3)
+    assert token != Token("Symbol", "x", 4)
+    assert token != ("Symbol", "x", 3)
+    assert len({token, Token("Symbol", "x", 3), Token("Number", "1", 3)}) == 2
+    assert pickle.loads(pickle.dumps(token)) == token
+    with pytest.raises(AttributeError):
+        token.text = "y"
+    with pytest.raises(AttributeError):
+        token.extra = None
 
 
 def test_unset():